@@ -1,13 +1,99 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from auth_app.cache import User, get_cached_user
+
+
+class ValidatedTokenCache:
+    """
+    Thread-safe per-process LRU of validated access tokens, keyed by the
+    SHA-256 of the raw token. Entries expire with the token itself.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(raw_token):
+        if isinstance(raw_token, str):
+            raw_token = raw_token.encode("utf-8")
+        return hashlib.sha256(raw_token).digest()
+
+    def get(self, raw_token):
+        key = self._key(raw_token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            token, expires = entry
+            if expires <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return token
+
+    def set(self, raw_token, token):
+        expires = token.get("exp")
+        if not expires:
+            return
+        key = self._key(raw_token)
+        with self._lock:
+            self._entries[key] = (token, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+validated_tokens = ValidatedTokenCache(settings.AUTH_TOKEN_CACHE_SIZE)
+
 
 class CookieJWTAuthentication(JWTAuthentication):
     """
     Custom JWT authentication class that retrieves the token from cookies.
+
+    Validated tokens are remembered per process for their remaining lifetime
+    and users are read from a Redis snapshot, so a warm request performs no
+    signature check and no database query.
     """
     def authenticate(self, request):
         raw_token = request.COOKIES.get("access_token")
         if not raw_token:
             return None
 
-        validated_token = self.get_validated_token(raw_token)
+        validated_token = validated_tokens.get(raw_token)
+        if validated_token is None:
+            validated_token = self.get_validated_token(raw_token)
+            validated_tokens.set(raw_token, validated_token)
         return self.get_user(validated_token), validated_token
+
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN:
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(
+                _("Token contained no recognizable user identification")) from e
+
+        try:
+            user = get_cached_user(user_id)
+        except User.DoesNotExist as e:
+            raise AuthenticationFailed(
+                _("User not found"), code="user_not_found") from e
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
@@ -1,7 +1,7 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
 from rest_framework import serializers
-from rest_framework.validators import UniqueValidator
+from auth_app.backends import users_by_email
 
 User = get_user_model()
 
@@ -12,15 +12,9 @@ class RegisterSerializer(serializers.ModelSerializer):
     """Handles user registration with password confirmation and validation."""
 
     confirmed_password = serializers.CharField(write_only=True)
-    email = serializers.EmailField(
-        required=True,
-        validators=[
-            UniqueValidator(
-                queryset=User.objects.all(),
-                message="A user with that email already exists."
-            )
-        ]
-    )
+    # Uniqueness is enforced by the case-insensitive email index; the
+    # view turns the IntegrityError of a duplicate insert into a 400.
+    email = serializers.EmailField(required=True)
 
     class Meta:
         model = User
@@ -47,15 +41,17 @@ class RegisterSerializer(serializers.ModelSerializer):
 # ------------------- Password Reset -------------------        
 
 class PasswordResetSerializer(serializers.Serializer):
-    """Validates email for password reset request."""
+    """Validates email for password reset request and resolves its user."""
 
     email = serializers.EmailField()
 
-    def validate_email(self, value):
-        if not User.objects.filter(email=value).exists():
+    def validate(self, attrs):
+        user = users_by_email(attrs["email"]).first()
+        if user is None:
             raise serializers.ValidationError(
-                "User with this email does not exist.")
-        return value
+                {"email": "User with this email does not exist."})
+        attrs["user"] = user
+        return attrs
 
 # ------------------- Password Reset Confirm -------------------
 
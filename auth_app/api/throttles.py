@@ -0,0 +1,121 @@
+"""
+Sliding-window rate limits for the unauthenticated auth endpoints.
+
+Each window is a Redis sorted set of request timestamps shared by all
+workers. Throttles run in ``APIView.initial()``, so a limited request is
+answered with 429 and ``Retry-After`` before any password is hashed or
+any email is queued.
+"""
+import hashlib
+import logging
+import re
+import uuid
+from django.core.exceptions import ImproperlyConfigured
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+from rest_framework.throttling import SimpleRateThrottle
+
+logger = logging.getLogger(__name__)
+
+RATE_PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+class SlidingWindowThrottle(SimpleRateThrottle):
+    """
+    Base class for Redis sliding-window throttles scoped per view.
+
+    The rate comes from ``DEFAULT_THROTTLE_RATES`` under
+    ``"<view.throttle_scope>.<ident_kind>"``. Rates accept a period
+    multiplier, e.g. ``"5/15m"``. Rejected requests are not counted, so
+    a client that keeps retrying is let in again once the window clears.
+    """
+
+    scope_attr = "throttle_scope"
+    ident_kind = None
+
+    def __init__(self):
+        # The scope is only known once the view calls allow_request().
+        pass
+
+    def parse_rate(self, rate):
+        if rate is None:
+            return (None, None)
+        match = re.fullmatch(r"(\d+)/(\d*)([smhd])[a-z]*", rate.strip())
+        if not match:
+            raise ImproperlyConfigured(
+                f"Invalid throttle rate {rate!r} for scope {self.scope!r}, "
+                f"expected e.g. '20/m' or '5/15m'.")
+        multiplier = int(match.group(2) or 1)
+        return (int(match.group(1)), multiplier * RATE_PERIODS[match.group(3)])
+
+    def get_ident_value(self, request):
+        raise NotImplementedError(".get_ident_value() must be overridden")
+
+    def get_cache_key(self, request, view):
+        ident = self.get_ident_value(request)
+        if not ident:
+            return None
+        return f"throttle:{self.scope}:{ident}"
+
+    def allow_request(self, request, view):
+        view_scope = getattr(view, self.scope_attr, None)
+        if not view_scope:
+            return True
+        self.scope = f"{view_scope}.{self.ident_kind}"
+        self.rate = self.THROTTLE_RATES.get(self.scope)
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        member = f"{self.now}:{uuid.uuid4().hex}"
+        try:
+            redis = get_redis_connection("default")
+            pipe = redis.pipeline()
+            pipe.zremrangebyscore(self.key, 0, self.now - self.duration)
+            pipe.zadd(self.key, {member: self.now})
+            pipe.zcard(self.key)
+            pipe.zrange(self.key, 0, 0, withscores=True)
+            pipe.expire(self.key, self.duration)
+            _, _, count, oldest, _ = pipe.execute()
+            if count <= self.num_requests:
+                return True
+            redis.zrem(self.key, member)
+        except RedisError:
+            logger.warning("Rate limit store unavailable, allowing request", exc_info=True)
+            return True
+
+        self.oldest = oldest[0][1] if oldest else self.now
+        return False
+
+    def wait(self):
+        """Seconds until the oldest request in the window expires."""
+        return max(self.oldest + self.duration - self.now, 1)
+
+
+class IPSlidingWindowThrottle(SlidingWindowThrottle):
+    """Limits requests per client address."""
+
+    ident_kind = "ip"
+
+    def get_ident_value(self, request):
+        return self.get_ident(request)
+
+
+class AccountSlidingWindowThrottle(SlidingWindowThrottle):
+    """
+    Limits requests per target account, identified by the submitted email,
+    so distributed attempts against one address are limited as well.
+    """
+
+    ident_kind = "account"
+
+    def get_ident_value(self, request):
+        email = request.data.get("email") if hasattr(request.data, "get") else None
+        if not isinstance(email, str) or not email.strip():
+            return None
+        return hashlib.sha256(email.strip().lower().encode()).hexdigest()
@@ -2,17 +2,22 @@ from rest_framework import generics, status
 from .serializers import RegisterSerializer, PasswordResetSerializer, PasswordResetConfirmSerializer
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.contrib.auth import get_user_model, authenticate
+from adrf.views import APIView as AsyncAPIView
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
 from django.utils.encoding import force_str, force_bytes
 from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
-from rest_framework_simplejwt.tokens import RefreshToken, TokenError, OutstandingToken, BlacklistedToken
-from auth_app.tokens import account_activation_token, password_reset_token
+from rest_framework_simplejwt.tokens import TokenError
+from auth_app.tokens import account_activation_token, password_reset_token, RevocableRefreshToken
 from .permissions import HasRefreshTokenCookie
+from .throttles import AccountSlidingWindowThrottle, IPSlidingWindowThrottle
 from rest_framework.permissions import AllowAny
 from django.conf import settings
-from django.db import transaction
-from django_rq import get_queue
-from auth_app.tasks import send_activation_email, send_password_reset_email
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from auth_app.tasks import queue_email
+from auth_app.revocation import revoke_user_tokens
+from auth_app.hashing import aauthenticate
 User = get_user_model()
 
 # ------------------- Registration & Activation -------------------
@@ -26,6 +31,8 @@ class RegisterView(generics.CreateAPIView):
     serializer_class = RegisterSerializer
     permission_classes = [AllowAny]
     authentication_classes = []
+    throttle_classes = [IPSlidingWindowThrottle, AccountSlidingWindowThrottle]
+    throttle_scope = "register"
 
     def post(self, request):
         serializer = self.get_serializer(data=request.data)
@@ -34,7 +41,15 @@ class RegisterView(generics.CreateAPIView):
                 {"detail": "Registration failed."},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        user = serializer.save()
+        try:
+            with transaction.atomic():
+                user = serializer.save()
+        except IntegrityError:
+            # Duplicate email (case-insensitive index) or username.
+            return Response(
+                {"detail": "Registration failed."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
         # UID & Token
         uidb64 = urlsafe_base64_encode(force_bytes(user.pk))
@@ -45,11 +60,8 @@ class RegisterView(generics.CreateAPIView):
             f"?uid={uidb64}&token={token}"
         )
 
-        def enqueue_email():
-            queue = get_queue("default", autocommit=True)
-            queue.enqueue(send_activation_email, user.email, activation_link)
-
-        transaction.on_commit(enqueue_email)
+        transaction.on_commit(
+            lambda: queue_email("activation", user.email, activation_link))
 
         return Response(
             {"detail": "Registration successful. Please check your email to activate your account."},
@@ -94,13 +106,18 @@ class ActivateAccountView(APIView):
 # ------------------- Login -------------------
 
 
-class LoginView(APIView):
+class LoginView(AsyncAPIView):
 
-    """POST /api/login/ - Authenticates user and sets HTTP-only cookies."""
+    """
+    POST /api/login/ - Authenticates user and sets HTTP-only cookies.
+    The password check runs in the bounded hashing pool.
+    """
     permission_classes = [AllowAny]
     authentication_classes = []
+    throttle_classes = [IPSlidingWindowThrottle, AccountSlidingWindowThrottle]
+    throttle_scope = "login"
 
-    def post(self, request):
+    async def post(self, request):
         email = request.data.get("email")
         password = request.data.get("password")
 
@@ -108,7 +125,7 @@ class LoginView(APIView):
             return Response({"detail": "Email and password are required."},
                             status=status.HTTP_400_BAD_REQUEST)
 
-        user = authenticate(request, username=email, password=password)
+        user = await aauthenticate(request, email=email, password=password)
 
         if user is None:
             return Response({"detail": "Invalid credentials."},
@@ -118,7 +135,7 @@ class LoginView(APIView):
             return Response({"detail": "Account not activated."},
                             status=status.HTTP_403_FORBIDDEN)
 
-        refresh = RefreshToken.for_user(user)
+        refresh = await sync_to_async(RevocableRefreshToken.for_user)(user)
         access = refresh.access_token
 
         response = Response({
@@ -159,8 +176,10 @@ class LogoutView(APIView):
             return Response({"detail": "No refresh token provided."},
                             status=status.HTTP_400_BAD_REQUEST)
 
-        token = RefreshToken(refresh_token)
-        token.blacklist()
+        try:
+            RevocableRefreshToken(refresh_token).blacklist()
+        except TokenError:
+            pass  # already invalid or revoked; still clear the cookies
 
         response = Response(
             {"detail": "Logout successful! All tokens deleted."},
@@ -187,7 +206,7 @@ class TokenRefreshView(APIView):
             )
 
         try:
-            token = RefreshToken(refresh_token)
+            token = RevocableRefreshToken(refresh_token)
             access_token = str(token.access_token)
         except TokenError:
             return Response(
@@ -216,12 +235,19 @@ class PasswordResetView(APIView):
     """POST /api/password_reset/ - Sends password reset link to user's email."""
     permission_classes = []
     authentication_classes = []
+    throttle_classes = [IPSlidingWindowThrottle, AccountSlidingWindowThrottle]
+    throttle_scope = "password_reset"
 
     def post(self, request):
         serializer = PasswordResetSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        email = serializer.validated_data["email"]
-        user = User.objects.get(email=email)
+        user = serializer.validated_data["user"]
+
+        # A reset mail queued moments ago is still valid; don't send another.
+        if not cache.add(f"password-reset-pending:{user.pk}", 1,
+                         settings.PASSWORD_RESET_COALESCE_SECONDS):
+            return Response({"detail": "An email has been sent to reset your password."},
+                            status=status.HTTP_200_OK)
 
         uidb64 = urlsafe_base64_encode(force_bytes(user.pk))
         token = password_reset_token.make_token(user)
@@ -229,11 +255,8 @@ class PasswordResetView(APIView):
         reset_link = (f"{settings.FRONTEND_URL}/pages/auth/confirm_password.html"
                       f"?uid={uidb64}&token={token}")
 
-        def enqueue_email():
-            queue = get_queue("default", autocommit=True)
-            queue.enqueue(send_password_reset_email, user.email, reset_link)
-
-        transaction.on_commit(enqueue_email)
+        transaction.on_commit(
+            lambda: queue_email("password_reset", user.email, reset_link))
 
         return Response({"detail": "An email has been sent to reset your password."},
                         status=status.HTTP_200_OK)
@@ -261,8 +284,7 @@ class PasswordResetConfirmView(APIView):
         user.set_password(new_password)
         user.save()
 
-        for t in OutstandingToken.objects.filter(user=user):
-            BlacklistedToken.objects.get_or_create(token=t)
+        revoke_user_tokens(user)
 
         response = Response(
             {"detail": "Password successfully reset."}, status=200)
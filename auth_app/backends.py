@@ -0,0 +1,44 @@
+"""
+Email-based authentication backed by the case-insensitive unique index
+``auth_user_email_ci_uniq`` on ``LOWER(email)`` (see migration 0003).
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db.models.functions import Lower
+
+User = get_user_model()
+
+EMAIL_INDEX_NAME = "auth_user_email_ci_uniq"
+
+
+def users_by_email(email):
+    """
+    Returns a queryset matching ``email`` case-insensitively. The filter
+    is phrased exactly like the partial expression index so the database
+    can answer it with a single index probe.
+    """
+    return User.objects.alias(email_ci=Lower("email")).filter(
+        email_ci=email.strip().lower(), email__gt="")
+
+
+class EmailBackend(ModelBackend):
+    """
+    Authenticates ``email``/``password`` pairs with one indexed query.
+    Calls without ``email`` (e.g. the admin login) use the usual username
+    lookup.
+    """
+
+    def authenticate(self, request, username=None, password=None, email=None, **kwargs):
+        if email is None:
+            return super().authenticate(request, username, password, **kwargs)
+        if not email or password is None:
+            return None
+
+        user = users_by_email(email).first()
+        if user is None:
+            # Run the hasher anyway so unknown addresses take as long as known ones.
+            User().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
@@ -0,0 +1,42 @@
+"""
+Redis-backed snapshots of users for request authentication.
+
+Only the fields needed to authorise a request are cached. The snapshot is
+rebuilt as a model instance with every other field deferred, so reading
+e.g. ``password`` lazily loads it and ``save()`` only writes the loaded
+fields. Snapshots are dropped by ``auth_app.signals`` whenever a user is
+saved or deleted.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+User = get_user_model()
+
+# Kept in model field order, which ``Model.from_db`` expects for partial rows.
+SNAPSHOT_FIELDS = tuple(
+    field.attname for field in User._meta.concrete_fields
+    if field.attname in {"id", "username", "email", "is_active", "is_staff", "is_superuser"}
+)
+
+
+def user_cache_key(user_id):
+    return f"auth-user:{user_id}"
+
+
+def get_cached_user(user_id):
+    """
+    Returns the user with the given id from the snapshot cache, loading and
+    caching it on a miss. Raises ``User.DoesNotExist`` if there is no such user.
+    """
+    key = user_cache_key(user_id)
+    values = cache.get(key)
+    if values is None:
+        values = User.objects.values_list(*SNAPSHOT_FIELDS).get(pk=user_id)
+        cache.set(key, values, settings.AUTH_USER_CACHE_TIMEOUT)
+    return User.from_db(DEFAULT_DB_ALIAS, SNAPSHOT_FIELDS, values)
+
+
+def invalidate_cached_user(user_id):
+    cache.delete(user_cache_key(user_id))
@@ -0,0 +1,39 @@
+"""
+Bounded thread pool for password checks.
+
+PBKDF2 is CPU bound and releases the GIL, so running ``authenticate`` in a
+small dedicated pool lets async views keep serving other requests while
+capping how many cores a burst of login attempts can occupy. Further
+logins queue for a free thread instead of piling up.
+"""
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.db import close_old_connections
+
+password_executor = ThreadPoolExecutor(
+    max_workers=settings.AUTH_HASH_WORKERS,
+    thread_name_prefix="password-hash",
+)
+
+
+def _authenticate(request, credentials):
+    try:
+        return authenticate(request, **credentials)
+    finally:
+        # Pool threads outlive requests; apply the usual CONN_MAX_AGE rules.
+        close_old_connections()
+
+
+async def aauthenticate(request, **credentials):
+    """
+    Runs ``django.contrib.auth.authenticate`` in the password pool, in a
+    copy of the caller's context so per-request state (e.g. the query
+    counter of the metrics middleware) follows it.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        password_executor, context.run, _authenticate, request, credentials)
@@ -0,0 +1,72 @@
+import time
+from django.core import mail
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from auth_app.tasks import (
+    build_queued_email, compiled_template, logo_bytes, send_email_batch,
+)
+
+
+class Command(BaseCommand):
+    """
+    Compares the old one-connection-per-mail sending path against the
+    batch sender. Runs against the locmem backend by default; pass
+    ``--backend smtp`` with EMAIL_HOST pointing at a local SMTP stand-in
+    (e.g. ``python -m aiosmtpd -n -l localhost:1025``) to include
+    connection setup costs.
+    """
+
+    help = "Benchmark single vs. batched activation email sending."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=500,
+                            help="Mails per scenario.")
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--backend", choices=["locmem", "smtp"], default="locmem")
+
+    def handle(self, *args, **options):
+        count = options["messages"]
+        batch_size = options["batch_size"]
+        backend = f"django.core.mail.backends.{options['backend']}.EmailBackend"
+        items = [
+            {"kind": "activation", "email": f"user{i}@example.com",
+             "link": f"https://example.com/activate?uid={i}&token=x"}
+            for i in range(count)
+        ]
+
+        with override_settings(EMAIL_BACKEND=backend):
+            results = {
+                "single (cold)": self.run(self.send_single_cold, items),
+                "single (cached)": self.run(self.send_single_cached, items),
+                "batch": self.run(lambda items: self.send_batched(items, batch_size), items),
+            }
+
+        for name, elapsed in results.items():
+            self.stdout.write(
+                f"{name:16} {count / elapsed:10.0f} mails/s  ({elapsed * 1000:.1f} ms)")
+
+    def run(self, sender, items):
+        mail.outbox = []
+        start = time.perf_counter()
+        sender(items)
+        elapsed = time.perf_counter() - start
+        if hasattr(mail, "outbox") and len(mail.outbox) != len(items):
+            self.stderr.write(f"Expected {len(items)} mails, got {len(mail.outbox)}")
+        return elapsed
+
+    def send_single_cold(self, items):
+        """The previous behaviour: fresh templates, logo and connection per mail."""
+        for item in items:
+            compiled_template.cache_clear()
+            logo_bytes.cache_clear()
+            build_queued_email(item).send(fail_silently=False)
+
+    def send_single_cached(self, items):
+        for item in items:
+            build_queued_email(item).send(fail_silently=False)
+
+    def send_batched(self, items, batch_size):
+        with get_connection(fail_silently=False) as connection:
+            for i in range(0, len(items), batch_size):
+                send_email_batch(items[i:i + batch_size], connection)
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from auth_app.revocation import restore_revocations_from_db
+from auth_app.tasks import drain_email_outbox, schedule_token_pruning
+
+
+class Command(BaseCommand):
+    """
+    Schedules the recurring maintenance jobs (idempotent), sends mail left
+    in the outbox and restores Redis revocation keys from the durable
+    blacklist mirror.
+    """
+
+    help = "Schedule recurring RQ maintenance jobs."
+
+    def handle(self, *args, **options):
+        schedule_token_pruning(delay=0)
+        self.stdout.write("Scheduled refresh token pruning.")
+        waiting = drain_email_outbox()
+        if waiting:
+            self.stdout.write(f"Queued {waiting} waiting emails.")
+        if settings.TOKEN_REVOCATION_DB_MIRROR:
+            restored = restore_revocations_from_db()
+            self.stdout.write(f"Restored {restored} token revocations.")
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.10 on 2026-10-18 21:40
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+INDEX_NAME = "auth_user_email_ci_uniq"
+
+
+def create_email_index(apps, schema_editor):
+    """
+    Adds a unique index on LOWER(email), ignoring blank emails. Lookups
+    filter on the same ``> ''`` predicate so the planner can use it.
+    Aborts with the conflicting addresses if existing users violate it.
+    """
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    duplicates = list(
+        User.objects.exclude(email="").annotate(email_ci=Lower("email"))
+        .values("email_ci").annotate(n=Count("id")).filter(n__gt=1)
+        .values_list("email_ci", flat=True)
+    )
+    if duplicates:
+        raise RuntimeError(
+            "Resolve duplicate user emails before migrating: " + ", ".join(duplicates))
+
+    quote = schema_editor.quote_name
+    schema_editor.execute(
+        f"CREATE UNIQUE INDEX {quote(INDEX_NAME)} "
+        f"ON {quote(User._meta.db_table)} (LOWER({quote('email')})) "
+        f"WHERE {quote('email')} > ''"
+    )
+
+
+def drop_email_index(apps, schema_editor):
+    schema_editor.execute(f"DROP INDEX IF EXISTS {schema_editor.quote_name(INDEX_NAME)}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_app', '0002_delete_customuser'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(create_email_index, drop_email_index),
+    ]
@@ -0,0 +1,86 @@
+"""
+Refresh token revocation.
+
+Revocations live in Redis: one key per revoked JTI and one "revoked
+before" timestamp per user, each expiring together with the tokens it
+covers. Checking a token is a single MGET. The simplejwt blacklist tables
+are kept as an optional durable mirror (``TOKEN_REVOCATION_DB_MIRROR``)
+that can repopulate Redis after a flush.
+"""
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+
+def jti_key(jti):
+    return f"revoked-jti:{jti}"
+
+
+def user_key(user_id):
+    return f"revoked-user:{user_id}"
+
+
+def revoke_jti(jti, expires):
+    """Marks a single token as revoked until it would have expired anyway."""
+    ttl = int(expires - time.time())
+    if ttl > 0:
+        cache.set(jti_key(jti), 1, ttl)
+
+
+def revoke_user_tokens(user):
+    """
+    Revokes every refresh token issued to a user up to now, e.g. after a
+    password reset, and mirrors it to the blacklist tables if enabled.
+    """
+    lifetime = api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()
+    cache.set(user_key(user.pk), time.time(), int(lifetime))
+    if settings.TOKEN_REVOCATION_DB_MIRROR:
+        blacklist_user_tokens(user)
+
+
+def is_revoked(payload):
+    """
+    Checks a token payload against both revocation keys in one round trip.
+    Tokens issued in the same second as a user-wide revocation but after
+    it stay valid, as ``RevocableRefreshToken`` issues sub-second ``iat``.
+    """
+    user_id = payload.get(api_settings.USER_ID_CLAIM)
+    keys = [jti_key(payload.get(api_settings.JTI_CLAIM)), user_key(user_id)]
+    values = cache.get_many(keys)
+    if keys[0] in values:
+        return True
+    revoked_before = values.get(keys[1])
+    return revoked_before is not None and payload.get("iat", 0) < revoked_before
+
+
+def blacklist_user_tokens(user):
+    """
+    Blacklists every unexpired refresh token of a user in one INSERT.
+    Tokens that are already blacklisted are skipped by the unique constraint.
+    """
+    token_ids = OutstandingToken.objects.filter(
+        user=user, expires_at__gt=timezone.now()
+    ).order_by().values_list("id", flat=True)
+    BlacklistedToken.objects.bulk_create(
+        [BlacklistedToken(token_id=token_id) for token_id in token_ids],
+        ignore_conflicts=True,
+    )
+
+
+def restore_revocations_from_db():
+    """
+    Re-populates the Redis revocation keys from the blacklist tables for
+    tokens that have not expired yet. Returns the number of keys written.
+    """
+    now = timezone.now()
+    rows = BlacklistedToken.objects.filter(
+        token__expires_at__gt=now
+    ).values_list("token__jti", "token__expires_at")
+    count = 0
+    for jti, expires_at in rows.iterator():
+        revoke_jti(jti, expires_at.timestamp())
+        count += 1
+    return count
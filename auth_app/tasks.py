@@ -1,6 +1,14 @@
 from django.conf import settings
-from django.template.loader import render_to_string
-from django.core.mail import EmailMultiAlternatives
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.template.loader import get_template
+from django.utils import timezone
+from datetime import timedelta
+from functools import lru_cache
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+import json
+import uuid
+from core.queues import enqueue, enqueue_in, get_queue_for
+from rq import get_current_job
 from email.mime.image import MIMEImage
 from pathlib import Path
 import logging
@@ -9,64 +17,172 @@ logger = logging.getLogger(__name__)
 
 LOGO_PATH = Path(settings.BASE_DIR) / "static" / "email" / "logo_icon.png"
 
+EMAIL_OUTBOX_KEY = "videoflix:email-outbox"
+EMAIL_DRAIN_FLAG_KEY = "videoflix:email-outbox:scheduled"
+EMAIL_DEAD_LETTER_KEY = "videoflix:email-outbox:dead"
 
-def send_html_email(
+EMAIL_KINDS = {
+    "activation": {
+        "subject": "Confirm your email",
+        "link_name": "activation_link",
+        "text_template": "confirm_email.txt",
+        "html_template": "confirm_email.html",
+    },
+    "password_reset": {
+        "subject": "Reset your password",
+        "link_name": "reset_link",
+        "text_template": "password_email.txt",
+        "html_template": "password_email.html",
+    },
+}
+
+
+@lru_cache(maxsize=None)
+def logo_bytes():
+    """Reads the inline logo once per worker process."""
+    with open(LOGO_PATH, "rb") as f:
+        return f.read()
+
+
+@lru_cache(maxsize=None)
+def compiled_template(name):
+    """Returns a compiled template, loaded once per worker process."""
+    return get_template(name)
+
+
+def build_html_email(
     *,
     subject: str,
     to_email: str,
     context: dict,
     text_template: str,
     html_template: str,
+    connection=None,
 ):
     """
-    Sends an HTML email with a plain-text fallback and an inline logo image.
-   """
-    text_content = render_to_string(text_template, context)
-    html_content = render_to_string(html_template, context)
-
+    Builds an HTML email with a plain-text fallback and an inline logo image.
+    """
     msg = EmailMultiAlternatives(
         subject=subject,
-        body=text_content,
+        body=compiled_template(text_template).render(context),
         from_email=settings.DEFAULT_FROM_EMAIL,
         to=[to_email],
+        connection=connection,
     )
-
-    msg.attach_alternative(html_content, "text/html")
+    msg.attach_alternative(compiled_template(html_template).render(context), "text/html")
     msg.mixed_subtype = "related"
 
-    try:
-        with open(LOGO_PATH, "rb") as f:
-            img = MIMEImage(f.read(), _subtype="png")
-            img.add_header("Content-ID", "<logo_id>")
-            img.add_header(
-                "Content-Disposition",
-                "inline",
-                filename="logo_icon.png",
-            )
-            msg.attach(img)
+    img = MIMEImage(logo_bytes(), _subtype="png")
+    img.add_header("Content-ID", "<logo_id>")
+    img.add_header("Content-Disposition", "inline", filename="logo_icon.png")
+    msg.attach(img)
+    return msg
 
-        msg.send(fail_silently=False)
 
+def send_html_email(**kwargs):
+    """
+    Sends a single HTML email over its own connection.
+   """
+    try:
+        build_html_email(**kwargs).send(fail_silently=False)
     except Exception as exc:
         logger.exception("Email sending failed")
         raise exc
 
 
+def build_queued_email(item: dict, connection=None):
+    """Builds the message for an outbox entry ``{"kind", "email", "link"}``."""
+    kind = EMAIL_KINDS[item["kind"]]
+    return build_html_email(
+        subject=kind["subject"],
+        to_email=item["email"],
+        context={"username": item["email"], kind["link_name"]: item["link"]},
+        text_template=kind["text_template"],
+        html_template=kind["html_template"],
+        connection=connection,
+    )
+
+
+def send_email_batch(items, connection=None):
+    """
+    Sends outbox entries over one backend connection with ``send_messages``.
+    Returns the number of messages sent.
+    """
+    connection = connection or get_connection(fail_silently=False)
+    messages = [build_queued_email(item, connection) for item in items]
+    return connection.send_messages(messages) or 0
+
+
+def queue_email(kind: str, email: str, link: str):
+    """
+    Adds a mail to the shared outbox and makes sure one drain job is
+    pending. Concurrent callers enqueue at most one job until it starts.
+    """
+    if kind not in EMAIL_KINDS:
+        raise ValueError(f"Unknown email kind: {kind}")
+    redis = get_queue_for(send_pending_emails).connection
+    redis.rpush(EMAIL_OUTBOX_KEY, json.dumps({"kind": kind, "email": email, "link": link}))
+    if redis.set(EMAIL_DRAIN_FLAG_KEY, 1, nx=True, ex=settings.EMAIL_BATCH_FLAG_TTL):
+        enqueue(send_pending_emails)
+
+
+def send_pending_emails(batch_size=None):
+    """
+    Drains the outbox over a single SMTP session, taking ``EMAIL_BATCH_SIZE``
+    entries from Redis at a time. Mails are sent one by one on the open
+    connection, so when sending fails only the mails not yet sent are
+    pushed back to the head of the outbox before the error is re-raised,
+    and the retried job does not resend the others. Entries that cannot be
+    parsed are moved to ``EMAIL_DEAD_LETTER_KEY`` instead of blocking it.
+    Returns the number of messages sent.
+    """
+    batch_size = batch_size or settings.EMAIL_BATCH_SIZE
+    redis = get_queue_for(send_pending_emails).connection
+    # Cleared before draining so mails queued from now on schedule a new job.
+    redis.delete(EMAIL_DRAIN_FLAG_KEY)
+    sent = 0
+
+    with get_connection(fail_silently=False) as connection:
+        while True:
+            raw = redis.lpop(EMAIL_OUTBOX_KEY, batch_size)
+            if not raw:
+                break
+            for index, item in enumerate(raw):
+                try:
+                    message = build_queued_email(json.loads(item), connection)
+                except (ValueError, KeyError, TypeError):
+                    logger.exception(f"Dropping malformed outbox entry: {item!r}")
+                    redis.rpush(EMAIL_DEAD_LETTER_KEY, item)
+                    continue
+                try:
+                    sent += connection.send_messages([message]) or 0
+                except Exception:
+                    logger.exception("Queued email sending failed")
+                    redis.lpush(EMAIL_OUTBOX_KEY, *reversed(raw[index:]))
+                    raise
+
+    logger.info(f"Sent {sent} queued emails")
+    return sent
+
+
+def drain_email_outbox():
+    """
+    Enqueues a drain job if mail is waiting and none is pending, e.g. after
+    a drain job was lost. Returns the number of waiting mails.
+    """
+    redis = get_queue_for(send_pending_emails).connection
+    waiting = redis.llen(EMAIL_OUTBOX_KEY)
+    if waiting and redis.set(EMAIL_DRAIN_FLAG_KEY, 1, nx=True, ex=settings.EMAIL_BATCH_FLAG_TTL):
+        enqueue(send_pending_emails)
+    return waiting
+
+
 def send_activation_email(email: str, activation_link: str):
 
     """
     Sends an account activation email with an activation link.
     """
-    send_html_email(
-        subject="Confirm your email",
-        to_email=email,
-        context={
-            "username": email,
-            "activation_link": activation_link,
-        },
-        text_template="confirm_email.txt",
-        html_template="confirm_email.html",
-    )
+    send_email_batch([{"kind": "activation", "email": email, "link": activation_link}])
 
 
 def send_password_reset_email(email: str, reset_link: str):
@@ -74,13 +190,59 @@ def send_password_reset_email(email: str, reset_link: str):
     """
     Sends a password reset email with a reset link.
    """
-    send_html_email(
-        subject="Reset your password",
-        to_email=email,
-        context={
-            "username": email,
-            "reset_link": reset_link,
-        },
-        text_template="password_email.txt",
-        html_template="password_email.html",
-    )
+    send_email_batch([{"kind": "password_reset", "email": email, "link": reset_link}])
+
+
+PRUNE_SCHEDULED_KEY = "videoflix:prune-token-tables:scheduled"
+
+
+def prune_token_tables(batch_size=None, reschedule=True):
+    """
+    Deletes expired outstanding and blacklisted refresh tokens in batches of
+    ``TOKEN_PRUNE_BATCH_SIZE`` rows, so no single statement holds long locks,
+    then schedules its next run after ``TOKEN_PRUNE_INTERVAL`` seconds.
+    Returns the number of outstanding tokens deleted.
+    """
+    batch_size = batch_size or settings.TOKEN_PRUNE_BATCH_SIZE
+    job = get_current_job()
+    if reschedule and job is not None:
+        # Released by the scheduled run itself, not by its retries, so
+        # exactly one next run gets scheduled even if this one fails.
+        redis = get_queue_for(prune_token_tables).connection
+        if redis.get(PRUNE_SCHEDULED_KEY) == job.id.encode():
+            redis.delete(PRUNE_SCHEDULED_KEY)
+    now = timezone.now()
+    deleted = 0
+
+    try:
+        while True:
+            ids = list(
+                OutstandingToken.objects.filter(expires_at__lte=now)
+                .order_by().values_list("id", flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            BlacklistedToken.objects.filter(token_id__in=ids).delete()
+            OutstandingToken.objects.filter(id__in=ids).delete()
+            deleted += len(ids)
+    finally:
+        if reschedule:
+            schedule_token_pruning()
+
+    logger.info(f"Pruned {deleted} expired refresh tokens")
+    return deleted
+
+
+def schedule_token_pruning(delay=None):
+    """
+    Schedules the next pruning run unless one is already pending. Every
+    run gets its own job id, since a finished job's hash expires after its
+    ``result_ttl``. The pending run's id is kept in a marker key that
+    expires an interval after the run is due, so a lost run does not block
+    scheduling forever. Needs a worker started with ``--with-scheduler``.
+    """
+    delay = settings.TOKEN_PRUNE_INTERVAL if delay is None else delay
+    redis = get_queue_for(prune_token_tables).connection
+    job_id = f"prune-token-tables-{uuid.uuid4().hex}"
+    if redis.set(PRUNE_SCHEDULED_KEY, job_id, nx=True, ex=delay + settings.TOKEN_PRUNE_INTERVAL):
+        enqueue_in(timedelta(seconds=delay), prune_token_tables, job_id=job_id)
@@ -0,0 +1,207 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.exceptions import ImproperlyConfigured
+from django.core.mail.backends import locmem
+from django.db import connection
+from django.test import override_settings
+from django_redis import get_redis_connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenError
+from rest_framework_simplejwt.tokens import RefreshToken
+from auth_app.api.authentication import CookieJWTAuthentication, validated_tokens
+from auth_app.api.throttles import IPSlidingWindowThrottle, SlidingWindowThrottle
+from auth_app.revocation import revoke_user_tokens
+from auth_app.tasks import (
+    EMAIL_DEAD_LETTER_KEY, EMAIL_DRAIN_FLAG_KEY, EMAIL_OUTBOX_KEY, send_pending_emails)
+from auth_app.tokens import RevocableRefreshToken
+from core.queues import get_queue_for
+from video_app.hls import segment_name
+from video_app.models import Video
+from video_app.signing import current_expiry, segment_signature
+from video_app.storage import get_media_storage
+
+User = get_user_model()
+
+
+class WarmAuthenticationTests(APITestCase):
+    """Warm segment requests are authenticated without touching the database."""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        get_media_storage.cache_clear()
+        self.addCleanup(get_media_storage.cache_clear)
+        validated_tokens.clear()
+
+        self.user = User.objects.create_user(
+            username="viewer@example.com", email="viewer@example.com", password="secret-password")
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+        self.client.cookies["access_token"] = self.token
+
+        self.video = Video.objects.create(title="Movie")
+        path = get_media_storage().path(segment_name(self.video.id, "480p", "index0.ts"))
+        os.makedirs(os.path.dirname(path))
+        with open(path, "wb") as f:
+            f.write(b"\x47" * 188 * 4)
+        self.url = f"/api/video/{self.video.id}/480p/index0.ts/"
+
+    def authenticate(self):
+        request = APIRequestFactory().get(self.url)
+        request.COOKIES["access_token"] = self.token
+        return CookieJWTAuthentication().authenticate(Request(request))
+
+    def test_segment_authentication_makes_no_queries_once_warm(self):
+        self.authenticate()
+        with self.assertNumQueries(0):
+            user, token = self.authenticate()
+        self.assertEqual(user.pk, self.user.pk)
+
+    def test_warm_signed_segment_request_makes_no_queries(self):
+        expires = current_expiry()
+        signature = segment_signature(self.video.id, "480p", "index0.ts", expires)
+        url = f"{self.url}?exp={expires}&sig={signature}"
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_warm_segment_request_only_looks_up_the_video(self):
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(queries), 1)
+        self.assertIn(Video._meta.db_table, queries[0]["sql"])
+
+    def test_deactivated_user_is_rejected_while_token_is_cached(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+
+class UserRevocationTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="viewer@example.com", email="viewer@example.com", password="secret-password")
+
+    def test_revocation_covers_tokens_issued_before_it_only(self):
+        before = str(RevocableRefreshToken.for_user(self.user))
+        revoke_user_tokens(self.user)
+        after = str(RevocableRefreshToken.for_user(self.user))
+
+        with self.assertRaises(TokenError):
+            RevocableRefreshToken(before)
+        # Usually issued within the same second as the revocation.
+        self.assertEqual(RevocableRefreshToken(after)["user_id"], str(self.user.pk))
+
+
+class EmailOutboxTests(APITestCase):
+
+    def setUp(self):
+        self.redis = get_queue_for(send_pending_emails).connection
+        keys = [EMAIL_OUTBOX_KEY, EMAIL_DRAIN_FLAG_KEY, EMAIL_DEAD_LETTER_KEY]
+        self.redis.delete(*keys)
+        self.addCleanup(self.redis.delete, *keys)
+
+    def push(self, *emails):
+        for email in emails:
+            self.redis.rpush(EMAIL_OUTBOX_KEY, json.dumps(
+                {"kind": "activation", "email": email, "link": "https://example.com/activate"}))
+
+    def test_failed_send_requeues_only_unsent_mails(self):
+        self.push("a@example.com", "b@example.com", "c@example.com")
+        send_messages = locmem.EmailBackend.send_messages
+
+        def fail_on_second(backend, messages):
+            if len(mail.outbox) == 1:
+                raise ConnectionError("SMTP went away")
+            return send_messages(backend, messages)
+
+        with mock.patch.object(locmem.EmailBackend, "send_messages", fail_on_second):
+            with self.assertRaises(ConnectionError):
+                send_pending_emails()
+        self.assertEqual(
+            [json.loads(item)["email"] for item in self.redis.lrange(EMAIL_OUTBOX_KEY, 0, -1)],
+            ["b@example.com", "c@example.com"])
+
+        self.assertEqual(send_pending_emails(), 2)
+        self.assertEqual([message.to for message in mail.outbox],
+                         [["a@example.com"], ["b@example.com"], ["c@example.com"]])
+
+    def test_malformed_entry_is_dead_lettered(self):
+        self.redis.rpush(EMAIL_OUTBOX_KEY, "not json", json.dumps({"kind": "unknown"}))
+        self.push("a@example.com")
+
+        self.assertEqual(send_pending_emails(), 1)
+        self.assertEqual(self.redis.llen(EMAIL_OUTBOX_KEY), 0)
+        self.assertEqual(self.redis.llen(EMAIL_DEAD_LETTER_KEY), 2)
+
+
+class ThrottleIdentTests(APITestCase):
+
+    def ident(self, **headers):
+        request = Request(APIRequestFactory().post("/api/login/", REMOTE_ADDR="203.0.113.7", **headers))
+        return IPSlidingWindowThrottle().get_ident_value(request)
+
+    def test_forwarded_for_is_ignored_without_proxies(self):
+        self.assertEqual(self.ident(HTTP_X_FORWARDED_FOR="198.51.100.1"), "203.0.113.7")
+
+    @override_settings(REST_FRAMEWORK={"NUM_PROXIES": 1})
+    def test_forwarded_for_is_trusted_past_configured_proxies(self):
+        self.assertEqual(
+            self.ident(HTTP_X_FORWARDED_FOR="198.51.100.1, 192.0.2.9"), "192.0.2.9")
+
+
+class ThrottleRateTests(APITestCase):
+
+    def parse(self, rate):
+        throttle = IPSlidingWindowThrottle()
+        throttle.scope = "login.ip"
+        return throttle.parse_rate(rate)
+
+    def test_rates_accept_period_multipliers(self):
+        self.assertEqual(self.parse("20/m"), (20, 60))
+        self.assertEqual(self.parse("5/15min"), (5, 900))
+        self.assertEqual(self.parse("3/hour"), (3, 3600))
+
+    def test_malformed_rate_names_the_scope(self):
+        for rate in ["20/minute5", "20", "/m", "20/5", "twenty/m"]:
+            with self.subTest(rate=rate):
+                with self.assertRaisesMessage(ImproperlyConfigured, "login.ip"):
+                    self.parse(rate)
+
+    def clear_windows(self):
+        redis = get_redis_connection("default")
+        for key in redis.scan_iter("throttle:register.*"):
+            redis.delete(key)
+
+    def test_registration_is_limited_per_account(self):
+        rates = {"register.ip": None, "register.account": "1/h"}
+        self.clear_windows()
+        self.addCleanup(self.clear_windows)
+        body = {"password": "secret-password", "confirmed_password": "secret-password"}
+
+        with mock.patch.object(SlidingWindowThrottle, "THROTTLE_RATES", rates):
+            first = self.client.post(
+                "/api/register/", {**body, "email": "new@example.com"}, format="json")
+            again = self.client.post(
+                "/api/register/", {**body, "email": " NEW@example.com"}, format="json")
+            other = self.client.post(
+                "/api/register/", {**body, "email": "other@example.com"}, format="json")
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(again.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(other.status_code, status.HTTP_201_CREATED)
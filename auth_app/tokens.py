@@ -1,4 +1,10 @@
+from django.conf import settings
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from auth_app.revocation import is_revoked, revoke_jti
 
 class AccountActivationTokenGenerator(PasswordResetTokenGenerator):
     """
@@ -15,4 +21,26 @@ class PasswordResetTokenGeneratorCustom(PasswordResetTokenGenerator):
         return f"{user.pk}{timestamp}{user.password}{user.last_login}"
     
 account_activation_token = AccountActivationTokenGenerator()
-password_reset_token = PasswordResetTokenGeneratorCustom()
\ No newline at end of file
+password_reset_token = PasswordResetTokenGeneratorCustom()
+
+
+class RevocableRefreshToken(RefreshToken):
+    """
+    Refresh token whose blacklist check is a single Redis lookup instead of
+    a query against the blacklist tables.
+    """
+    def __init__(self, token=None, verify=True):
+        super().__init__(token, verify)
+        if token is None:
+            # NumericDate may be fractional; whole seconds could not tell a
+            # token minted right after a password reset from one before it.
+            self.payload["iat"] = self.current_time.timestamp()
+
+    def check_blacklist(self):
+        if is_revoked(self.payload):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        revoke_jti(self.payload[api_settings.JTI_CLAIM], self.payload["exp"])
+        if settings.TOKEN_REVOCATION_DB_MIRROR:
+            return super().blacklist()
@@ -38,6 +38,39 @@ else:
     print(f"Superuser '{username}' already exists.")
 EOF
 
-python manage.py rqworker default &
+# Metrics of all gunicorn and RQ worker processes are aggregated from here.
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
+python manage.py schedule_maintenance
+# One worker pool per queue, so emails are never stuck behind transcodes.
+# Every worker runs the scheduler for its queues (retries with backoff and
+# delayed jobs); RQ makes sure only one scheduler is active per queue.
+start_workers() {
+  count=$1
+  shift
+  i=0
+  while [ "$i" -lt "$count" ]; do
+    python manage.py rqworker "$@" --with-scheduler &
+    i=$((i + 1))
+  done
+}
+
+start_workers "${RQ_TRANSCODE_WORKERS:-1}" transcode
+start_workers "${RQ_EMAIL_WORKERS:-1}" email
+start_workers "${RQ_MAINTENANCE_WORKERS:-1}" maintenance default
+
+# SERVER_MODE=asgi runs uvicorn workers: streaming clients only hold a
+# coroutine, so concurrency is bounded by file descriptors and bandwidth.
+# Worker count comes from WEB_CONCURRENCY (gunicorn's default: 1).
+if [ "$SERVER_MODE" = "asgi" ]; then
+  ulimit -n "${ASGI_MAX_OPEN_FILES:-65536}" 2>/dev/null || true
+  exec gunicorn core.asgi:application \
+    --worker-class uvicorn_worker.UvicornWorker \
+    --bind 0.0.0.0:8000 \
+    --keep-alive 75 \
+    --graceful-timeout 30
+fi
 
 exec gunicorn core.wsgi:application --bind 0.0.0.0:8000 --reload
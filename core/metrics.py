@@ -0,0 +1,156 @@
+"""
+Prometheus metrics.
+
+With ``PROMETHEUS_MULTIPROC_DIR`` set (see ``backend.entrypoint.sh``) every
+gunicorn and RQ worker process writes its samples to memory-mapped files in
+that directory and ``/metrics`` aggregates them on scrape, so incrementing a
+metric is a lock-free local write. Without it, the in-process registry is
+used (development server, tests).
+"""
+import os
+import time
+from contextvars import ContextVar
+import django_rq
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram,
+    generate_latest, multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+from redis.exceptions import RedisError
+
+MULTIPROCESS = "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+REQUEST_LATENCY = Histogram(
+    "videoflix_http_request_duration_seconds",
+    "Time until the response is returned (streamed bodies excluded), by view.",
+    ["view", "method", "status"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUEST_DB_QUERIES = Histogram(
+    "videoflix_http_db_queries",
+    "Database queries executed per request, by view.",
+    ["view"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50),
+)
+SEGMENT_BYTES = Counter(
+    "videoflix_segment_bytes_served",
+    "HLS segment bytes sent by Django, by rendition.",
+    ["resolution"],
+)
+SEGMENT_CACHE_REQUESTS = Counter(
+    "videoflix_segment_cache_requests",
+    "Lookups in the shared hot-segment cache, by result (hit or miss).",
+    ["result"],
+)
+SEGMENT_CACHE_EVICTIONS = Counter(
+    "videoflix_segment_cache_evictions",
+    "Entries evicted from the shared hot-segment cache to stay within its budget.",
+)
+SEGMENT_PREFETCH = Counter(
+    "videoflix_segment_prefetch",
+    "Segment files handed to readahead (advised) or skipped because the node was busy (dropped).",
+    ["result"],
+)
+TRANSCODE_DURATION = Histogram(
+    "videoflix_transcode_duration_seconds",
+    "Wall time of one rendition encode in convert_resolutions.",
+    ["resolution", "status"],
+    buckets=(10, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200),
+)
+
+_query_count = ContextVar("query_count", default=None)
+
+
+def count_queries(execute, sql, params, many, context):
+    """Execute wrapper adding to the current request's query counter, if any."""
+    counter = _query_count.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+connection_created.connect(install_query_counter)
+
+
+def start_query_count():
+    """
+    Starts counting queries for the current context. The counter is a
+    mutable list, so queries run via ``sync_to_async`` (which copies the
+    context) are counted as well.
+    """
+    counter = [0]
+    return counter, _query_count.set(counter)
+
+
+def stop_query_count(token):
+    _query_count.reset(token)
+
+
+def record_segment_bytes(resolution, response):
+    """Counts the body of a successful segment response."""
+    if response.status_code in (200, 206) and response.has_header("Content-Length"):
+        SEGMENT_BYTES.labels(resolution).inc(int(response["Content-Length"]))
+
+
+class RQQueueCollector:
+    """Reports queue depth and the age of the oldest waiting job at scrape time."""
+
+    def collect(self):
+        depth = GaugeMetricFamily(
+            "videoflix_rq_queue_jobs", "Jobs waiting in an RQ queue.", labels=["queue"])
+        age = GaugeMetricFamily(
+            "videoflix_rq_oldest_job_age_seconds",
+            "Seconds the oldest waiting job has been queued.", labels=["queue"])
+        failed = GaugeMetricFamily(
+            "videoflix_rq_failed_jobs", "Jobs in the failed registry.", labels=["queue"])
+
+        for name in settings.RQ_QUEUES:
+            try:
+                queue = django_rq.get_queue(name)
+                depth.add_metric([name], queue.count)
+                failed.add_metric([name], queue.failed_job_registry.count)
+                job_ids = queue.get_job_ids(0, 1)
+                job = queue.fetch_job(job_ids[0]) if job_ids else None
+                oldest = job.enqueued_at.timestamp() if job and job.enqueued_at else None
+                age.add_metric([name], time.time() - oldest if oldest else 0)
+            except RedisError:
+                continue
+        yield depth
+        yield age
+        yield failed
+
+
+queue_collector = RQQueueCollector()
+if not MULTIPROCESS:
+    REGISTRY.register(queue_collector)
+
+
+def metrics_registry():
+    if not MULTIPROCESS:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(queue_collector)
+    return registry
+
+
+def metrics_view(request):
+    """
+    GET /metrics - Prometheus text exposition. Requires
+    ``Authorization: Bearer <METRICS_AUTH_TOKEN>``; without that setting
+    every request is denied, as the metrics describe views and traffic.
+    """
+    token = settings.METRICS_AUTH_TOKEN
+    if not token or not constant_time_compare(
+            request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return HttpResponseForbidden()
+    return HttpResponse(generate_latest(metrics_registry()), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,116 @@
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from core.metrics import (
+    REQUEST_DB_QUERIES, REQUEST_LATENCY, start_query_count, stop_query_count,
+)
+from core.routers import STICKY_COOKIE, end_request, start_request
+
+
+HTTP_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+
+def view_name(request):
+    """Returns the resolved view's class or function name as a metric label."""
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched"
+    func = getattr(match.func, "view_class", match.func)
+    return func.__name__
+
+
+class MetricsMiddleware:
+    """
+    Records latency and database query counts per view. Works natively in
+    both sync and async stacks, so async views are not forced into a thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        counter, token = start_query_count()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            stop_query_count(token)
+        self.observe(request, response, time.perf_counter() - start, counter[0])
+        return response
+
+    async def __acall__(self, request):
+        counter, token = start_query_count()
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            stop_query_count(token)
+        self.observe(request, response, time.perf_counter() - start, counter[0])
+        return response
+
+    def observe(self, request, response, elapsed, queries):
+        view = view_name(request)
+        method = request.method if request.method in HTTP_METHODS else "other"
+        REQUEST_LATENCY.labels(view, method, response.status_code).observe(elapsed)
+        REQUEST_DB_QUERIES.labels(view).observe(queries)
+
+
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+class DatabaseRoutingMiddleware:
+    """
+    Lets ``core.routers.PrimaryReplicaRouter`` send the reads of safe
+    requests to a replica. Unsafe requests and clients that wrote recently
+    (``db_primary`` cookie) stay on the primary.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        state, token = start_request(self.pins_primary(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            end_request(token)
+        return self.process_response(state, response)
+
+    async def __acall__(self, request):
+        state, token = start_request(self.pins_primary(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            end_request(token)
+        return self.process_response(state, response)
+
+    @staticmethod
+    def pins_primary(request):
+        return request.method not in SAFE_METHODS or STICKY_COOKIE in request.COOKIES
+
+    @staticmethod
+    def process_response(state, response):
+        if state.wrote:
+            response.set_cookie(
+                STICKY_COOKIE, "1",
+                max_age=settings.DB_REPLICA_STICKY_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
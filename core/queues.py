@@ -0,0 +1,58 @@
+"""
+Routing of background jobs to RQ queues.
+
+Every job is enqueued through ``enqueue``/``enqueue_in`` below, which pick
+the queue from ``JOB_ROUTES`` and apply that queue's retry policy. Queue
+timeouts are configured per queue in ``settings.RQ_QUEUES``.
+"""
+import django_rq
+from rq import Retry
+
+DEFAULT_QUEUE = "default"
+
+JOB_ROUTES = {
+    "video_app.tasks.convert_resolutions": "transcode",
+    "video_app.uploads.finish_upload": "transcode",
+    "video_app.tasks.generate_thumbnails": "maintenance",
+    "auth_app.tasks.send_pending_emails": "email",
+    "auth_app.tasks.send_activation_email": "email",
+    "auth_app.tasks.send_password_reset_email": "email",
+    "auth_app.tasks.prune_token_tables": "maintenance",
+}
+
+# Transcode failures are mostly deterministic (broken source, codec) and
+# rungs are retried selectively from the admin, so they are not retried
+# automatically. Emails back off quickly to ride out SMTP hiccups.
+RETRY_POLICIES = {
+    "transcode": None,
+    "email": {"max": 5, "interval": [5, 15, 60, 300, 900]},
+    "maintenance": {"max": 3, "interval": [60, 300, 900]},
+}
+
+
+def queue_name_for(func):
+    return JOB_ROUTES.get(f"{func.__module__}.{func.__qualname__}", DEFAULT_QUEUE)
+
+
+def get_queue_for(func):
+    """Returns the queue a job function is routed to."""
+    return django_rq.get_queue(queue_name_for(func), autocommit=True)
+
+
+def _with_retry(queue_name, kwargs):
+    policy = RETRY_POLICIES.get(queue_name)
+    if policy and "retry" not in kwargs:
+        kwargs["retry"] = Retry(**policy)
+    return kwargs
+
+
+def enqueue(func, *args, **kwargs):
+    """Enqueues ``func`` on its routed queue with the queue's retry policy."""
+    queue = get_queue_for(func)
+    return queue.enqueue(func, *args, **_with_retry(queue.name, kwargs))
+
+
+def enqueue_in(delay, func, *args, **kwargs):
+    """Schedules ``func`` on its routed queue after ``delay`` (a timedelta)."""
+    queue = get_queue_for(func)
+    return queue.enqueue_in(delay, func, *args, **_with_retry(queue.name, kwargs))
@@ -0,0 +1,102 @@
+"""
+Database routing between the primary and its read replicas.
+
+Reads made while serving a safe (GET/HEAD/OPTIONS) request go to one
+replica, picked per request so all its reads see the same snapshot.
+Everything else uses the primary: writes, reads inside a transaction,
+unsafe requests, and code running outside a request (RQ jobs,
+management commands), which often reads rows it has just been told about.
+
+Read-your-writes: once a request writes, its remaining reads use the
+primary, and ``DatabaseRoutingMiddleware`` sets a cookie that pins the
+client to the primary for ``DB_REPLICA_STICKY_SECONDS``, which should
+exceed the replicas' replication lag.
+"""
+import logging
+import random
+import time
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+STICKY_COOKIE = "db_primary"
+
+
+class RoutingState:
+    """Routing decisions of one request, shared with threads it starts via sync_to_async."""
+
+    __slots__ = ("primary", "replica", "wrote")
+
+    def __init__(self, primary):
+        self.primary = primary
+        self.replica = None
+        self.wrote = False
+
+
+_state = ContextVar("db_routing_state", default=None)
+_unavailable = {}
+
+
+def start_request(primary):
+    """Starts routing a request. Returns ``(state, token)``."""
+    state = RoutingState(primary)
+    return state, _state.set(state)
+
+
+def end_request(token):
+    _state.reset(token)
+
+
+def use_primary():
+    """Sends the rest of the current request's reads to the primary."""
+    state = _state.get()
+    if state is not None:
+        state.primary = True
+
+
+def replica_available(alias):
+    """
+    Checks that a replica accepts connections. A replica that fails is
+    skipped for ``DB_REPLICA_RETRY_SECONDS`` instead of failing requests.
+    """
+    if _unavailable.get(alias, 0) > time.monotonic():
+        return False
+    connection = connections[alias]
+    if connection.connection is None:
+        try:
+            connection.ensure_connection()
+        except DatabaseError as e:
+            logger.warning(f"Database replica {alias} is unavailable: {e}")
+            _unavailable[alias] = time.monotonic() + settings.DB_REPLICA_RETRY_SECONDS
+            return False
+    _unavailable.pop(alias, None)
+    return True
+
+
+class PrimaryReplicaRouter:
+    """Routes request reads to ``DATABASE_REPLICAS`` and everything else to the primary."""
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.primary or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if state.replica is None:
+            replicas = [alias for alias in settings.DATABASE_REPLICAS if replica_available(alias)]
+            state.replica = random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.primary = True
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
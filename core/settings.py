@@ -59,6 +59,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "core.middleware.MetricsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -100,10 +101,34 @@ DATABASES = {
         "USER": os.environ.get("DB_USER", default="videoflix_user"),
         "PASSWORD": os.environ.get("DB_PASSWORD", default="supersecretpassword"),
         "HOST": os.environ.get("DB_HOST", default="db"),
-        "PORT": os.environ.get("DB_PORT", default=5432)
+        "PORT": os.environ.get("DB_PORT", default=5432),
+        # Connections are kept for this many seconds and checked before reuse.
+        # Django advises against persistent connections under ASGI.
+        "CONN_MAX_AGE": int(os.environ.get(
+            "DB_CONN_MAX_AGE", 0 if os.environ.get("SERVER_MODE") == "asgi" else 60)),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
+# Read replicas as comma-separated host[:port] entries sharing the primary's
+# database name and credentials; reads of safe requests are routed to them.
+for index, replica in enumerate(filter(None, os.environ.get("DB_REPLICA_HOSTS", "").split(",")), 1):
+    host, _, port = replica.strip().partition(":")
+    DATABASES[f"replica_{index}"] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "PORT": port or DATABASES["default"]["PORT"],
+        "TEST": {"MIRROR": "default"},
+    }
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != "default"]
+DATABASE_ROUTERS = ["core.routers.PrimaryReplicaRouter"] if DATABASE_REPLICAS else []
+if DATABASE_REPLICAS:
+    MIDDLEWARE.insert(1, "core.middleware.DatabaseRoutingMiddleware")
+# Clients that wrote read from the primary for this long (should exceed replication lag).
+DB_REPLICA_STICKY_SECONDS = int(os.environ.get("DB_REPLICA_STICKY_SECONDS", 10))
+# A replica that refused a connection is skipped for this long.
+DB_REPLICA_RETRY_SECONDS = int(os.environ.get("DB_REPLICA_RETRY_SECONDS", 30))
+
 CACHES = {
     "default": {
         "BACKEND": "django_redis.cache.RedisCache",
@@ -115,15 +140,41 @@ CACHES = {
     }
 }
 
+RQ_CONNECTION = {
+    'HOST': os.environ.get("REDIS_HOST", default="redis"),
+    'PORT': os.environ.get("REDIS_PORT", default=6379),
+    'DB': os.environ.get("REDIS_DB", default=0),
+    'REDIS_CLIENT_KWARGS': {},
+}
+
+# Jobs are routed to these queues in core/queues.py; each queue has its own
+# workers (see backend.entrypoint.sh) so emails never wait behind transcodes.
+# 'default' only drains jobs enqueued before the split.
 RQ_QUEUES = {
-    'default': {
-        'HOST': os.environ.get("REDIS_HOST", default="redis"),
-        'PORT': os.environ.get("REDIS_PORT", default=6379),
-        'DB': os.environ.get("REDIS_DB", default=0),
-        'DEFAULT_TIMEOUT': 900,
-        'REDIS_CLIENT_KWARGS': {},
+    'default': {**RQ_CONNECTION, 'DEFAULT_TIMEOUT': 900},
+    'transcode': {
+        **RQ_CONNECTION,
+        'DEFAULT_TIMEOUT': int(os.environ.get("RQ_TRANSCODE_TIMEOUT", 4 * 3600)),
+    },
+    'email': {
+        **RQ_CONNECTION,
+        'DEFAULT_TIMEOUT': int(os.environ.get("RQ_EMAIL_TIMEOUT", 120)),
+    },
+    'maintenance': {
+        **RQ_CONNECTION,
+        'DEFAULT_TIMEOUT': int(os.environ.get("RQ_MAINTENANCE_TIMEOUT", 900)),
     },
 }
+
+# Workers clean up the metric files of their work horses.
+RQ = {"WORKER_CLASS": "core.workers.MetricsWorker"}
+
+# Bearer token required to scrape /metrics; the endpoint is disabled without it.
+METRICS_AUTH_TOKEN = os.environ.get("METRICS_AUTH_TOKEN", "")
+
+# Email/password logins are looked up through the case-insensitive email index.
+AUTHENTICATION_BACKENDS = ["auth_app.backends.EmailBackend"]
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -165,6 +216,68 @@ STATIC_ROOT = BASE_DIR / "static"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Video processing
+# 0 sizes the transcode pool to the worker's cores (one FFmpeg per rung at most).
+VIDEO_TRANSCODE_WORKERS = int(os.environ.get("VIDEO_TRANSCODE_WORKERS", 0))
+VIDEO_X264_PRESET = os.environ.get("VIDEO_X264_PRESET", "veryfast")
+VIDEO_HLS_SEGMENT_SECONDS = int(os.environ.get("VIDEO_HLS_SEGMENT_SECONDS", 10))
+VIDEO_PROGRESS_INTERVAL = float(os.environ.get("VIDEO_PROGRESS_INTERVAL", 2))
+
+# Small files stay in memory; larger ones are hashed while being spooled.
+FILE_UPLOAD_HANDLERS = [
+    "django.core.files.uploadhandler.MemoryFileUploadHandler",
+    "video_app.uploads.HashingFileUploadHandler",
+]
+VIDEO_UPLOAD_MAX_BYTES = int(
+    os.environ.get("VIDEO_UPLOAD_MAX_BYTES", 20 * 1024 ** 3))
+VIDEO_UPLOAD_CHUNK_SIZE = int(
+    os.environ.get("VIDEO_UPLOAD_CHUNK_SIZE", 1024 * 1024))
+VIDEO_THUMBNAIL_WIDTHS = [
+    int(width) for width in os.environ.get(
+        "VIDEO_THUMBNAIL_WIDTHS", "320,640,1280").split(",")
+]
+
+# Video storage
+# "local" keeps sources and HLS output below MEDIA_ROOT, "s3" in an S3-compatible bucket.
+VIDEO_STORAGE_BACKEND = os.environ.get("VIDEO_STORAGE_BACKEND", "local")
+VIDEO_S3_BUCKET = os.environ.get("VIDEO_S3_BUCKET", "videoflix")
+# Leave empty for AWS; set to the MinIO (or other S3-compatible) URL otherwise.
+VIDEO_S3_ENDPOINT_URL = os.environ.get("VIDEO_S3_ENDPOINT_URL", "")
+# Host presigned URLs are issued for, if clients reach storage under another name.
+VIDEO_S3_PUBLIC_ENDPOINT_URL = os.environ.get("VIDEO_S3_PUBLIC_ENDPOINT_URL", "")
+VIDEO_S3_REGION = os.environ.get("VIDEO_S3_REGION", "us-east-1")
+VIDEO_S3_ACCESS_KEY_ID = os.environ.get("VIDEO_S3_ACCESS_KEY_ID", "")
+VIDEO_S3_SECRET_ACCESS_KEY = os.environ.get("VIDEO_S3_SECRET_ACCESS_KEY", "")
+# Lifetime of the presigned URL FFmpeg reads a source from; must outlast a transcode.
+VIDEO_S3_INPUT_URL_TTL = int(os.environ.get("VIDEO_S3_INPUT_URL_TTL", 6 * 3600))
+
+# Video delivery
+# "nginx" sets X-Accel-Redirect, "xsendfile" sets X-Sendfile, empty serves from Django.
+VIDEO_SENDFILE_MODE = os.environ.get("VIDEO_SENDFILE_MODE", "")
+VIDEO_SENDFILE_URL = os.environ.get("VIDEO_SENDFILE_URL", "/protected-media/")
+VIDEO_SIGNED_URL_TTL = int(os.environ.get("VIDEO_SIGNED_URL_TTL", 3600))
+VIDEO_CATALOG_CACHE_TIMEOUT = int(
+    os.environ.get("VIDEO_CATALOG_CACHE_TIMEOUT", 300))
+VIDEO_MASTER_CACHE_TIMEOUT = int(
+    os.environ.get("VIDEO_MASTER_CACHE_TIMEOUT", 3600))
+VIDEO_MANIFEST_CACHE_SIZE = int(os.environ.get("VIDEO_MANIFEST_CACHE_SIZE", 512))
+VIDEO_MANIFEST_RECHECK_SECONDS = float(
+    os.environ.get("VIDEO_MANIFEST_RECHECK_SECONDS", 2))
+# Hot segments are kept in shared memory for all processes on a node (0 disables).
+VIDEO_SEGMENT_CACHE_BYTES = int(
+    os.environ.get("VIDEO_SEGMENT_CACHE_BYTES", 256 * 1024 ** 2))
+VIDEO_SEGMENT_CACHE_DIR = os.environ.get(
+    "VIDEO_SEGMENT_CACHE_DIR", "/dev/shm/videoflix-segments")
+# The first segments of every rendition are loaded after transcoding and kept longest.
+VIDEO_SEGMENT_CACHE_PIN_SEGMENTS = int(
+    os.environ.get("VIDEO_SEGMENT_CACHE_PIN_SEGMENTS", 3))
+# Segments read ahead after the one being served (0 disables).
+VIDEO_PREFETCH_SEGMENTS = int(os.environ.get("VIDEO_PREFETCH_SEGMENTS", 3))
+# Processes issuing readahead at the same time, per node.
+VIDEO_PREFETCH_CONCURRENCY = int(os.environ.get("VIDEO_PREFETCH_CONCURRENCY", 2))
+VIDEO_PREFETCH_LOCK_DIR = os.environ.get(
+    "VIDEO_PREFETCH_LOCK_DIR", "/dev/shm/videoflix-prefetch")
+
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 
@@ -178,13 +291,46 @@ SIMPLE_JWT = {
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1)
 }
 
+# Validated access tokens remembered per process / user snapshot TTL in Redis.
+AUTH_TOKEN_CACHE_SIZE = int(os.environ.get("AUTH_TOKEN_CACHE_SIZE", 4096))
+AUTH_USER_CACHE_TIMEOUT = int(os.environ.get("AUTH_USER_CACHE_TIMEOUT", 300))
+
+# Threads per process that may run password hashes concurrently (0 = one per core).
+AUTH_HASH_WORKERS = int(os.environ.get("AUTH_HASH_WORKERS", 0)) or os.cpu_count()
+
+# Revocations are checked in Redis; the blacklist tables are an optional durable mirror.
+TOKEN_REVOCATION_DB_MIRROR = os.environ.get(
+    "TOKEN_REVOCATION_DB_MIRROR", "True") == "True"
+
+# Expired refresh tokens are pruned by a recurring RQ job.
+TOKEN_PRUNE_INTERVAL = int(os.environ.get("TOKEN_PRUNE_INTERVAL", 3600))
+TOKEN_PRUNE_BATCH_SIZE = int(os.environ.get("TOKEN_PRUNE_BATCH_SIZE", 1000))
+
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
         'auth_app.api.authentication.CookieJWTAuthentication',
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ],
+    # Sliding-window limits for the auth endpoints, see auth_app.api.throttles.
+    "DEFAULT_THROTTLE_RATES": {
+        "login.ip": os.environ.get("THROTTLE_LOGIN_IP", "20/m"),
+        "login.account": os.environ.get("THROTTLE_LOGIN_ACCOUNT", "5/5m"),
+        "register.ip": os.environ.get("THROTTLE_REGISTER_IP", "5/h"),
+        "register.account": os.environ.get("THROTTLE_REGISTER_ACCOUNT", "3/h"),
+        "password_reset.ip": os.environ.get("THROTTLE_PASSWORD_RESET_IP", "10/h"),
+        "password_reset.account": os.environ.get("THROTTLE_PASSWORD_RESET_ACCOUNT", "3/h"),
+    },
+    # Reverse proxies in front of Django. Client addresses for the per-IP
+    # limits are only taken from X-Forwarded-For past this many hops, so
+    # clients cannot pick their own; 0 (the default compose setup, which
+    # exposes gunicorn directly) uses REMOTE_ADDR.
+    "NUM_PROXIES": int(os.environ.get("NUM_PROXIES", 0)),
 }
 
+# Repeated reset requests for one account within this window share the
+# email that is already queued.
+PASSWORD_RESET_COALESCE_SECONDS = int(os.environ.get("PASSWORD_RESET_COALESCE_SECONDS", 300))
+
 # Email Configuration
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = os.environ.get("EMAIL_HOST", "smtp.example.com")
@@ -194,3 +340,11 @@ EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
 EMAIL_USE_TLS = True
 EMAIL_USE_SSL = False
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'info@videoflix.com')
+
+# Activation and reset mails are queued in Redis and drained by one job
+# per burst over one SMTP session, EMAIL_BATCH_SIZE entries per Redis pop.
+EMAIL_BATCH_SIZE = int(os.environ.get("EMAIL_BATCH_SIZE", 100))
+# How long a lost drain job keeps new mails from enqueueing another one.
+# Mail it left behind goes out with the next queued mail or when
+# schedule_maintenance runs at startup.
+EMAIL_BATCH_FLAG_TTL = int(os.environ.get("EMAIL_BATCH_FLAG_TTL", 300))
@@ -0,0 +1,100 @@
+import asyncio
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, router, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TransactionTestCase, override_settings
+from core import routers
+from core.middleware import DatabaseRoutingMiddleware
+from core.routers import STICKY_COOKIE
+from video_app.models import Video
+
+
+@override_settings(
+    DATABASE_REPLICAS=["replica_1"],
+    DATABASE_ROUTERS=["core.routers.PrimaryReplicaRouter"],
+    DB_REPLICA_STICKY_SECONDS=10,
+    DB_REPLICA_RETRY_SECONDS=30,
+)
+class PrimaryReplicaRoutingTests(TransactionTestCase):
+    """
+    Routing decisions only. The replica alias is a stand-in connection, so
+    no query is sent to it; the primary is the test database.
+    """
+
+    def setUp(self):
+        self.replica = mock.Mock(connection=None)
+        patcher = mock.patch.object(routers, "connections", {
+            DEFAULT_DB_ALIAS: connections[DEFAULT_DB_ALIAS], "replica_1": self.replica})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        routers._unavailable.clear()
+        self.addCleanup(routers._unavailable.clear)
+
+    def serve(self, view, method="get", cookies=None):
+        """Runs ``view`` behind DatabaseRoutingMiddleware; returns its result and the response."""
+        result = []
+
+        def get_response(request):
+            result.append(view())
+            return HttpResponse()
+
+        request = getattr(RequestFactory(), method)("/api/video/")
+        request.COOKIES.update(cookies or {})
+        response = DatabaseRoutingMiddleware(get_response)(request)
+        return result[0], response
+
+    def test_reads_of_safe_requests_go_to_a_replica(self):
+        alias, response = self.serve(lambda: router.db_for_read(Video))
+        self.assertEqual(alias, "replica_1")
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+    def test_unsafe_requests_read_from_the_primary(self):
+        alias, _ = self.serve(lambda: router.db_for_read(Video), method="post")
+        self.assertEqual(alias, DEFAULT_DB_ALIAS)
+
+    def test_reads_inside_atomic_blocks_use_the_primary(self):
+        def read_in_transaction():
+            with transaction.atomic():
+                return router.db_for_read(Video)
+
+        alias, _ = self.serve(read_in_transaction)
+        self.assertEqual(alias, DEFAULT_DB_ALIAS)
+
+    def test_reads_after_a_write_use_the_primary_and_pin_the_client(self):
+        def read_write_read():
+            return [router.db_for_read(Video), router.db_for_write(Video),
+                    router.db_for_read(Video)]
+
+        aliases, response = self.serve(read_write_read)
+        self.assertEqual(aliases, ["replica_1", DEFAULT_DB_ALIAS, DEFAULT_DB_ALIAS])
+        self.assertEqual(response.cookies[STICKY_COOKIE]["max-age"], 10)
+
+        alias, _ = self.serve(
+            lambda: router.db_for_read(Video), cookies={STICKY_COOKIE: "1"})
+        self.assertEqual(alias, DEFAULT_DB_ALIAS)
+
+    def test_write_in_a_thread_of_an_async_request_pins_the_client(self):
+        async def get_response(request):
+            await sync_to_async(router.db_for_write)(Video)
+            return HttpResponse()
+
+        response = asyncio.run(
+            DatabaseRoutingMiddleware(get_response)(RequestFactory().get("/api/video/")))
+        self.assertIn(STICKY_COOKIE, response.cookies)
+
+    def test_code_outside_requests_uses_the_primary(self):
+        self.assertEqual(router.db_for_read(Video), DEFAULT_DB_ALIAS)
+
+    def test_unreachable_replica_is_skipped_until_the_retry_delay(self):
+        self.replica.ensure_connection.side_effect = OperationalError("connection refused")
+        with mock.patch.object(routers.time, "monotonic", return_value=1000.0), \
+                self.assertLogs("core.routers", "WARNING"):
+            self.assertEqual(self.serve(lambda: router.db_for_read(Video))[0], DEFAULT_DB_ALIAS)
+            self.assertEqual(self.serve(lambda: router.db_for_read(Video))[0], DEFAULT_DB_ALIAS)
+        self.assertEqual(self.replica.ensure_connection.call_count, 1)
+
+        self.replica.ensure_connection.side_effect = None
+        with mock.patch.object(routers.time, "monotonic", return_value=1031.0):
+            self.assertEqual(self.serve(lambda: router.db_for_read(Video))[0], "replica_1")
+        self.assertEqual(self.replica.ensure_connection.call_count, 2)
@@ -0,0 +1,28 @@
+"""
+RQ worker used by ``rqworker`` (``RQ["WORKER_CLASS"]``).
+
+Every job runs in a forked work horse, which writes its metric samples
+to files named after its own pid in ``PROMETHEUS_MULTIPROC_DIR``. The
+worker does the multiprocess bookkeeping for each horse once it exits.
+"""
+from prometheus_client import multiprocess
+from rq import Worker
+from core.metrics import MULTIPROCESS
+
+
+class MetricsWorker(Worker):
+    """Marks each work horse dead for the Prometheus multiprocess collector."""
+
+    _finished_horse_pid = 0
+
+    def execute_job(self, job, queue):
+        try:
+            super().execute_job(job, queue)
+        finally:
+            if MULTIPROCESS and self._finished_horse_pid:
+                multiprocess.mark_process_dead(self._finished_horse_pid)
+
+    def fork_work_horse(self, job, queue):
+        super().fork_work_horse(job, queue)
+        # RQ resets horse_pid once the horse is reaped.
+        self._finished_horse_pid = self.horse_pid
@@ -1,5 +1,23 @@
+from collections import defaultdict
 from django.contrib import admin
-from video_app.models import Video
+from django.contrib.postgres.search import SearchQuery
+from core.queues import enqueue
+from video_app.assets import attach_uploaded_source
+from video_app.models import SEARCH_CONFIG, Video, VideoRendition, RenditionStatus
+from video_app.tasks import convert_resolutions
+
+
+class VideoRenditionInline(admin.TabularInline):
+    model = VideoRendition
+    extra = 0
+    can_delete = False
+    fields = ("resolution", "status", "progress", "duration_seconds",
+              "output_bytes", "started_at", "finished_at", "error")
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
 
 @admin.register(Video)
 class VideoAdmin(admin.ModelAdmin):
@@ -7,3 +25,43 @@ class VideoAdmin(admin.ModelAdmin):
     list_display = ("title", "category", "created_at")
     list_filter = ("category", "created_at")
     search_fields = ("title", "description")
+    readonly_fields = ("asset",)
+    inlines = [VideoRenditionInline]
+
+    def get_search_results(self, request, queryset, search_term):
+        """Searches the indexed search vector instead of scanning with icontains."""
+        if not search_term:
+            return queryset, False
+        query = SearchQuery(search_term, search_type="websearch", config=SEARCH_CONFIG)
+        return queryset.filter(search_vector=query), False
+
+    def save_model(self, request, obj, form, change):
+        """New uploads are deduplicated by content hash before being stored."""
+        if not change and form.cleaned_data.get("source"):
+            attach_uploaded_source(obj, form.cleaned_data["source"])
+        super().save_model(request, obj, form, change)
+
+
+@admin.register(VideoRendition)
+class VideoRenditionAdmin(admin.ModelAdmin):
+
+    list_display = ("video", "resolution", "status", "progress",
+                    "duration_seconds", "output_bytes", "finished_at")
+    list_filter = ("status", "resolution")
+    list_select_related = ("video",)
+    ordering = ("-started_at",)
+    readonly_fields = ("progress", "started_at", "finished_at",
+                       "duration_seconds", "output_bytes", "error")
+    actions = ["retry_failed"]
+
+    @admin.action(description="Retry selected failed renditions")
+    def retry_failed(self, request, queryset):
+        """Re-enqueues only the failed rungs, grouped per video."""
+        failed = defaultdict(list)
+        for rendition in queryset.filter(status=RenditionStatus.FAILED).select_related("video"):
+            failed[rendition.video].append(rendition.resolution)
+
+        for video, resolutions in failed.items():
+            enqueue(convert_resolutions, video.id, video.source.name, resolutions)
+        self.message_user(
+            request, f"Re-enqueued {sum(map(len, failed.values()))} rendition(s).")
@@ -0,0 +1,25 @@
+from rest_framework.pagination import CursorPagination
+
+
+class VideoCursorPagination(CursorPagination):
+    """
+    Cursor pagination over the catalog, newest first.
+    The id tie-breaker keeps pages stable for videos created in the same instant.
+    """
+
+    ordering = ("-created_at", "-id")
+    page_size = 24
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+
+class VideoSearchPagination(VideoCursorPagination):
+    """
+    Cursor pagination over search results: best match first when a query
+    is given, otherwise newest first like the catalog.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        if view.search.get("q"):
+            return ("-rank", "-created_at", "-id")
+        return self.ordering
@@ -0,0 +1,19 @@
+from rest_framework.permissions import BasePermission
+from video_app.signing import verify_segment
+
+
+class HasValidSegmentSignature(BasePermission):
+    """
+    Allows access to a segment if the URL carries a valid, unexpired signature.
+    Sets ``request.signed_segment`` so the view knows access came from it.
+    """
+    def has_permission(self, request, view):
+        kwargs = view.kwargs
+        request.signed_segment = verify_segment(
+            kwargs["movie_id"],
+            kwargs["resolution"],
+            kwargs["segment"],
+            request.GET.get("exp"),
+            request.GET.get("sig"),
+        )
+        return request.signed_segment
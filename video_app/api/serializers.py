@@ -1,14 +1,38 @@
+from django.core.files.storage import default_storage
 from rest_framework import serializers
-from video_app.models import Video
+from video_app.models import Video, VideoCategory, VideoRendition
+
+
+class VideoRenditionSerializer(serializers.ModelSerializer):
+
+    """
+    Serializer for the transcode state of a single rendition.
+    Live progress is left out: list pages are cached until the next state
+    change, so it would only ever show a stale value.
+    """
+
+    class Meta:
+        model = VideoRendition
+        fields = [
+            'resolution',
+            'status',
+            'duration_seconds',
+            'output_bytes'
+        ]
+
 
 class VideoListSerializer(serializers.ModelSerializer):
     
     """
     Serializer for listing video details.
-    Includes a method to get the full URL for the thumbnail image.
+    Includes the full URL of the original thumbnail, absolute URLs of its
+    resized variants per format and width, and the transcode state of
+    each rendition.
     """
 
     thumbnail_url = serializers.SerializerMethodField()
+    thumbnails = serializers.SerializerMethodField()
+    renditions = VideoRenditionSerializer(many=True, read_only=True)
 
     class Meta:
         model = Video
@@ -18,11 +42,46 @@ class VideoListSerializer(serializers.ModelSerializer):
             'title',
             'description',
             'thumbnail_url',
-            'category'
+            'thumbnails',
+            'category',
+            'renditions'
         ]
 
     def get_thumbnail_url(self, obj):
         request = self.context.get('request')
         if obj.thumbnail and request:
             return request.build_absolute_uri(obj.thumbnail.url)
-        return None
\ No newline at end of file
+        return None
+
+    def get_thumbnails(self, obj):
+        request = self.context.get('request')
+        if not request:
+            return {}
+        return {
+            fmt: {
+                width: request.build_absolute_uri(default_storage.url(name))
+                for width, name in variants.items()
+            }
+            for fmt, variants in obj.thumbnails.items()
+            if fmt != "source"
+        }
+
+
+class VideoSearchParamsSerializer(serializers.Serializer):
+
+    """
+    Validates the query parameters of the search endpoint.
+    ``created_from`` and ``created_to`` are inclusive dates.
+    """
+
+    q = serializers.CharField(required=False, max_length=200, trim_whitespace=True)
+    category = serializers.ChoiceField(choices=VideoCategory.choices, required=False)
+    created_from = serializers.DateField(required=False)
+    created_to = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        if (attrs.get("created_from") and attrs.get("created_to")
+                and attrs["created_from"] > attrs["created_to"]):
+            raise serializers.ValidationError(
+                {"created_to": "Must not be before created_from."})
+        return attrs
@@ -0,0 +1,216 @@
+"""
+Helpers for delivering media files from the video API.
+
+Supports single-range ``Range``/``If-Range`` requests (206 Partial Content)
+and an optional offload mode in which Django only sets an
+``X-Accel-Redirect`` (nginx) or ``X-Sendfile`` (Apache/lighttpd) header and
+leaves the byte transfer to the front server.
+
+Under ASGI, file bodies are produced by async generators that read in a
+worker thread, so a slow client only holds a coroutine, not a thread.
+
+Callers may pass a ``SharedSegmentCache``; hits are answered from shared
+memory, misses are read into the cache (in a worker thread under ASGI).
+"""
+import asyncio
+import os
+import re
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, FileResponse, StreamingHttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+
+
+def file_etag(stat_result):
+    """Builds a strong ETag from a file's modification time and size."""
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def parse_range(header, size):
+    """
+    Parses a single byte range header against a file of the given size.
+
+    Returns a ``(start, end)`` tuple (inclusive), ``None`` if the header
+    is missing or not a single byte range, or ``False`` if the range
+    cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+
+    if not first:
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+def _if_range_matches(request, etag, last_modified):
+    """Checks whether an ``If-Range`` precondition still holds."""
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return if_range == etag
+    since = parse_http_date_safe(if_range)
+    return since is not None and int(last_modified) <= since
+
+
+def _read_range(path, start, length):
+    """Yields ``length`` bytes of the file starting at ``start``."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+async def _aread_range(path, start, length):
+    """
+    Async variant of ``_read_range``: each read runs in the default
+    executor, so the event loop never blocks on disk I/O.
+    """
+    f = await asyncio.to_thread(open, path, "rb")
+    try:
+        await asyncio.to_thread(f.seek, start)
+        remaining = length
+        while remaining > 0:
+            chunk = await asyncio.to_thread(f.read, min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def is_asgi_request(request):
+    """Tells whether a (DRF or Django) request is served over ASGI."""
+    return isinstance(getattr(request, "_request", request), ASGIRequest)
+
+
+def offload_response(path, content_type):
+    """
+    Returns an empty response that tells the front server to send the file.
+
+    In ``nginx`` mode the path is rewritten relative to ``MEDIA_ROOT`` and
+    prefixed with ``VIDEO_SENDFILE_URL``, which must point at an
+    ``internal`` location. In ``xsendfile`` mode the absolute path is used.
+    """
+    response = HttpResponse(content_type=content_type)
+    if settings.VIDEO_SENDFILE_MODE == "nginx":
+        relative = os.path.relpath(path, settings.MEDIA_ROOT)
+        response["X-Accel-Redirect"] = settings.VIDEO_SENDFILE_URL + \
+            relative.replace(os.sep, "/")
+    else:
+        response["X-Sendfile"] = str(path)
+    return response
+
+
+# Cache entries this process is loading in the background, by entry name.
+# Only touched from the event loop, so concurrent misses on a hot segment
+# read it once.
+_loading = set()
+
+
+def _load_in_background(cache, path, stat_result, pinned):
+    name = cache.entry_name(stat_result, pinned)
+    if name in _loading:
+        return
+    _loading.add(name)
+    future = asyncio.get_running_loop().run_in_executor(
+        None, cache.load, path, stat_result, pinned)
+    future.add_done_callback(lambda _: _loading.discard(name))
+
+
+def _cached_body(cache, path, stat_result, pinned, asgi):
+    """Returns the file's bytes from ``cache``, filling it on a miss."""
+    body = cache.get(stat_result, pinned)
+    if body is not None or stat_result.st_size > cache.max_entry_bytes:
+        return body
+    if not asgi:
+        return cache.load(path, stat_result, pinned)
+    # Never read a whole segment on the event loop; this request streams.
+    _load_in_background(cache, path, stat_result, pinned)
+    return None
+
+
+def serve_file(request, path, content_type, cache=None, pinned=False):
+    """
+    Serves a media file, honouring ``Range`` and ``If-Range`` headers.
+
+    Returns a 404 response if the file does not exist. When
+    ``VIDEO_SENDFILE_MODE`` is set the transfer (including ranges) is
+    delegated to the front server. Requests served over ASGI get an
+    async streaming body. With a ``cache``, the file is served from
+    shared memory when possible; ``pinned`` marks it as long-lived there.
+    """
+    try:
+        stat_result = os.stat(path)
+    except OSError:
+        return HttpResponse("File not found", status=404)
+
+    if settings.VIDEO_SENDFILE_MODE:
+        return offload_response(path, content_type)
+
+    asgi = is_asgi_request(request)
+    size = stat_result.st_size
+    etag = file_etag(stat_result)
+    byte_range = None
+    if _if_range_matches(request, etag, stat_result.st_mtime):
+        byte_range = parse_range(request.META.get("HTTP_RANGE"), size)
+
+    body = None
+    if cache is not None and byte_range is not False:
+        body = _cached_body(cache, path, stat_result, pinned, asgi)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+    elif body is not None and byte_range is None:
+        response = HttpResponse(body, content_type=content_type)
+        response["Content-Length"] = str(size)
+    elif body is not None:
+        start, end = byte_range
+        response = HttpResponse(body[start:end + 1], status=206, content_type=content_type)
+        response["Content-Length"] = str(end - start + 1)
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    elif byte_range is None and not asgi:
+        response = FileResponse(open(path, "rb"), content_type=content_type)
+    elif byte_range is None:
+        response = StreamingHttpResponse(
+            _aread_range(path, 0, size), content_type=content_type)
+        response["Content-Length"] = str(size)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        reader = _aread_range if asgi else _read_range
+        response = StreamingHttpResponse(
+            reader(path, start, length),
+            status=206,
+            content_type=content_type,
+        )
+        response["Content-Length"] = str(length)
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(stat_result.st_mtime)
+    return response
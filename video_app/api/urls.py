@@ -1,12 +1,19 @@
 """
 URL configurations for the video application API.
-Defines routes for listing videos, serving HLS manifests, and serving HLS segments.
+Defines routes for listing and searching videos, serving HLS master playlists and manifests, serving HLS segments, and resumable source uploads.
 """
 from django.urls import path
-from .views import VideoListView, VideoHLSManifestView, VideoHLSSegmentView
+from .views import VideoListView, VideoSearchView, VideoHLSMasterView, VideoHLSManifestView, VideoHLSSegmentView, VideoUploadCreateView, VideoUploadView
 
 urlpatterns = [
     path("video/", VideoListView.as_view(), name="video-list"),
+    path("video/search/", VideoSearchView.as_view(), name="video-search"),
+    path("video/uploads/", VideoUploadCreateView.as_view(),
+         name="video-upload-create"),
+    path("video/uploads/<uuid:upload_id>/", VideoUploadView.as_view(),
+         name="video-upload"),
+    path("video/<int:movie_id>/master.m3u8",
+         VideoHLSMasterView.as_view(), name="video-hls-master"),
     path("video/<int:movie_id>/<str:resolution>/index.m3u8",
          VideoHLSManifestView.as_view(), name="video-hls-manifest"),
     path("video/<int:movie_id>/<str:resolution>/<str:segment>/",
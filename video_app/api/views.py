@@ -1,91 +1,309 @@
+from adrf.generics import ListAPIView as AsyncListAPIView
+from adrf.views import APIView as AsyncAPIView
 from rest_framework.views import APIView
-from rest_framework.generics import ListAPIView
-from rest_framework.permissions import IsAuthenticated
-from video_app.models import Video
-from .serializers import VideoListSerializer
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from video_app.models import SEARCH_CONFIG, Video, VideoCategory, VideoRendition, VideoUpload, RenditionStatus
+from .serializers import VideoListSerializer, VideoSearchParamsSerializer
 from rest_framework.response import Response
 from auth_app.api.authentication import CookieJWTAuthentication
-import os
-from django.http import HttpResponse, FileResponse
+from datetime import datetime, time, timedelta
+from django.http import HttpResponse, HttpResponseRedirect
 from rest_framework import status
 from django.conf import settings
+from django.core.cache import cache
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import DatabaseError, transaction
+from django.db.models import DecimalField, Exists, F, OuterRef
+from django.db.models.functions import Cast
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import parse_etags
+from core.metrics import record_segment_bytes
+from core.queues import enqueue
+from core.routers import use_primary
+from video_app.cache import CATALOG_CHANGED_KEY, acatalog_page_key
+from video_app.hls import aget_master_playlist, manifest_cache, segment_name
+from video_app.signing import current_expiry, sign_manifest
+from video_app.prefetch import manifest_segment_names, next_segment_names, prefetch_segments
+from video_app.segment_cache import is_pinned_segment, segment_cache
+from video_app.storage import get_media_storage
+from video_app.uploads import TUS_VERSION, append_chunk, create_upload, finish_upload, parse_upload_metadata
+from .pagination import VideoCursorPagination, VideoSearchPagination
+from .permissions import HasValidSegmentSignature
+from .streaming import serve_file
 
 
-class VideoListView(ListAPIView):
+class VideoListView(AsyncListAPIView):
 
-    """Lists all available videos to authenticated users"""
+    """Lists videos with at least one playable rendition to authenticated users"""
 
     authentication_classes = [CookieJWTAuthentication]
     permission_classes = [IsAuthenticated]
     serializer_class = VideoListSerializer
-    queryset = Video.objects.all().order_by("-created_at")
+    queryset = Video.objects.filter(
+        Exists(VideoRendition.objects.filter(
+            video=OuterRef("pk"), status=RenditionStatus.READY))
+    ).prefetch_related("renditions").order_by("-created_at")
+    pagination_class = VideoCursorPagination
 
-    def get(self, request, *args, **kwargs):
-        videos = self.get_queryset()
-        serializer = self.get_serializer(
-            videos, many=True, context={"request": request})
-        return Response(serializer.data, status=status.HTTP_200_OK)
+    async def get(self, request, *args, **kwargs):
+        cache_key = await acatalog_page_key(request)
+        data = await cache.aget(cache_key)
+        if data is None:
+            # A page cached from a lagging replica would outlive the change.
+            if settings.DATABASE_REPLICAS and await cache.aget(CATALOG_CHANGED_KEY):
+                use_primary()
+            videos = await self.apaginate_queryset(self.get_queryset())
+            serializer = self.get_serializer(videos, many=True)
+            data = dict((await self.get_apaginated_response(serializer.data)).data)
+            await cache.aset(cache_key, data, settings.VIDEO_CATALOG_CACHE_TIMEOUT)
+        return Response(data, status=status.HTTP_200_OK)
 
 
-class VideoHLSManifestView(APIView):
+def start_of_day(date):
+    return timezone.make_aware(datetime.combine(date, time.min))
+
+
+class VideoSearchView(VideoListView):
+
+    """
+    Searches the playable catalog. ``q`` is matched against the stored
+    search vector (web search syntax, title weighted over description)
+    and ranked; ``category``, ``created_from`` and ``created_to`` filter
+    on the (category, created_at) index. Pages are cached like the catalog.
+    """
+
+    pagination_class = VideoSearchPagination
+
+    async def get(self, request, *args, **kwargs):
+        params = VideoSearchParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        self.search = params.validated_data
+        return await super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        search = self.search
+        if search.get("category"):
+            queryset = queryset.filter(category=search["category"])
+        if search.get("created_from"):
+            queryset = queryset.filter(created_at__gte=start_of_day(search["created_from"]))
+        if search.get("created_to"):
+            queryset = queryset.filter(
+                created_at__lt=start_of_day(search["created_to"] + timedelta(days=1)))
+        if search.get("q"):
+            query = SearchQuery(search["q"], search_type="websearch", config=SEARCH_CONFIG)
+            # The cursor stores the rank as text and filters with rank__lt,
+            # which only round-trips exactly for a fixed-precision value.
+            queryset = queryset.filter(search_vector=query).annotate(rank=Cast(
+                SearchRank(F("search_vector"), query),
+                DecimalField(max_digits=12, decimal_places=6)))
+        return queryset
+
+
+class VideoHLSManifestView(AsyncAPIView):
     
     """Serves HLS manifests to authenticated users """
 
     authentication_classes = [CookieJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
-    def get(self, request, movie_id, resolution):
-        video = Video.objects.filter(id=movie_id).first()
-        if not video:
-            return HttpResponse("Video not found", status=404)
-
-        manifest_path = os.path.join(
-            settings.MEDIA_ROOT,
-            'videos',
-            str(video.id),
-            resolution,
-            'index.m3u8'
-        )
-
-        if not os.path.exists(manifest_path):
+    async def get(self, request, movie_id, resolution):
+        # Hot manifests come from memory; a recheck or miss goes to media
+        # storage (a request to S3 in s3 mode) in a thread.
+        manifest = await manifest_cache.aget(movie_id, resolution)
+        if manifest is None:
+            if not await Video.objects.filter(id=movie_id).aexists():
+                return HttpResponse("Video not found", status=404)
             return HttpResponse(
                 'Manifest not found',
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        if not os.path.exists(manifest_path):
-            return HttpResponse("Manifest not found", status=404)
-
-        return FileResponse(
-            open(manifest_path, "rb"),
-            content_type="application/vnd.apple.mpegurl"
-        )
+        expires = current_expiry()
+        etag = f'{manifest.etag[:-1]}-{expires:x}"'
+        etags = parse_etags(request.META.get("HTTP_IF_NONE_MATCH", ""))
+        if etag in etags or "*" in etags:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = HttpResponse(
+                sign_manifest(manifest.body, movie_id, resolution, expires),
+                content_type="application/vnd.apple.mpegurl"
+            )
+        response["ETag"] = etag
+        response["Last-Modified"] = manifest.last_modified
+        # Playback starts right after the manifest; warm its first segments.
+        prefetch_segments(movie_id, resolution, manifest_segment_names(
+            manifest.body, settings.VIDEO_PREFETCH_SEGMENTS))
+        return response
 
 
-class VideoHLSSegmentView(APIView):
+class VideoHLSMasterView(AsyncAPIView):
 
-    """Serves HLS video segments to authenticated users"""
+    """Serves the multi-variant master playlist to authenticated users"""
 
     authentication_classes = [CookieJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
-    def get(self, request, movie_id, resolution, segment):
-        video = Video.objects.filter(id=movie_id).first()
-        if not video:
+    async def get(self, request, movie_id):
+        master = await aget_master_playlist(movie_id)
+        if master is None:
+            return HttpResponse(
+                "Master playlist not found",
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        body, etag = master
+        etags = parse_etags(request.META.get("HTTP_IF_NONE_MATCH", ""))
+        if etag in etags or "*" in etags:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = HttpResponse(
+                body, content_type="application/vnd.apple.mpegurl")
+        response["ETag"] = etag
+        return response
+
+
+class VideoHLSSegmentView(AsyncAPIView):
+
+    """
+    Serves HLS video segments to authenticated users.
+    Signed URLs from the manifest skip JWT decoding and the video lookup.
+    With object storage the client is redirected to a presigned URL instead.
+    """
+
+    authentication_classes = [CookieJWTAuthentication]
+    permission_classes = [HasValidSegmentSignature | IsAuthenticated]
+
+    def perform_authentication(self, request):
+        """Defers authentication until a permission actually needs the user."""
+        pass
+
+    async def get(self, request, movie_id, resolution, segment):
+        # Only a verified signature vouches for the video; a bogus one
+        # accepted through the JWT fallback still gets the lookup.
+        signed = getattr(request, "signed_segment", False)
+        if not signed and not await Video.objects.filter(id=movie_id).aexists():
             return HttpResponse("Video not found", status=404)
 
-        segment_path = os.path.join(
-            settings.MEDIA_ROOT,
-            "videos",
-            str(video.id),
-            resolution,
-            segment
-        )
-
-        if not os.path.exists(segment_path):
-            return HttpResponse("Segment not found", status=404)
-
-        return FileResponse(
-            open(segment_path, "rb"),
-            content_type="video/MP2T"
-        )
+        storage = get_media_storage()
+        name = segment_name(movie_id, resolution, segment)
+        if storage.redirects_downloads:
+            response = HttpResponseRedirect(
+                storage.download_url(name, settings.VIDEO_SIGNED_URL_TTL))
+            # Let the player reuse the redirect while the presigned URL is valid.
+            response["Cache-Control"] = f"private, max-age={settings.VIDEO_SIGNED_URL_TTL // 2}"
+            return response
+
+        response = serve_file(request, storage.path(name), "video/MP2T",
+                              cache=segment_cache, pinned=is_pinned_segment(segment))
+        record_segment_bytes(resolution, response)
+        if response.status_code in (200, 206):
+            prefetch_segments(movie_id, resolution, next_segment_names(
+                segment, settings.VIDEO_PREFETCH_SEGMENTS))
+        return response
+
+
+def _tus_response(upload=None, status_code=status.HTTP_204_NO_CONTENT, data=None):
+    """Builds a response carrying the tus protocol headers."""
+    response = Response(data, status=status_code)
+    response["Tus-Resumable"] = TUS_VERSION
+    response["Cache-Control"] = "no-store"
+    if upload is not None:
+        response["Upload-Offset"] = str(upload.offset)
+        response["Upload-Length"] = str(upload.length)
+    return response
+
+
+class VideoUploadCreateView(APIView):
+
+    """
+    POST /api/video/uploads/ - Starts a resumable source upload (staff only).
+    Expects ``Upload-Length`` and a tus ``Upload-Metadata`` header with at
+    least ``filename`` and optionally ``title``, ``description``, ``category``.
+    """
+
+    authentication_classes = [CookieJWTAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        try:
+            length = int(request.headers["Upload-Length"])
+        except (KeyError, ValueError):
+            return _tus_response(status_code=status.HTTP_400_BAD_REQUEST,
+                                 data={"detail": "Upload-Length header is required."})
+        if length <= 0 or length > settings.VIDEO_UPLOAD_MAX_BYTES:
+            return _tus_response(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                 data={"detail": "Invalid upload size."})
+
+        metadata = parse_upload_metadata(request.headers.get("Upload-Metadata", ""))
+        if not metadata.get("filename"):
+            return _tus_response(status_code=status.HTTP_400_BAD_REQUEST,
+                                 data={"detail": "Upload-Metadata must include a filename."})
+        if metadata.get("category") and metadata["category"] not in VideoCategory.values:
+            return _tus_response(status_code=status.HTTP_400_BAD_REQUEST,
+                                 data={"detail": "Invalid category."})
+
+        upload = create_upload(request.user, length, metadata)
+        response = _tus_response(upload, status.HTTP_201_CREATED)
+        response["Location"] = request.build_absolute_uri(
+            reverse("video-upload", args=[upload.id]))
+        return response
+
+
+class VideoUploadView(APIView):
+
+    """
+    HEAD  /api/video/uploads/<id>/ - Returns the acknowledged offset.
+    PATCH /api/video/uploads/<id>/ - Appends a chunk at ``Upload-Offset``.
+    Chunks must arrive in order; a mismatched offset gets 409 and the
+    current offset so the client can resume. The video is created by a
+    background job once the last byte arrives; an empty PATCH at the final
+    offset enqueues it again if it was lost.
+    """
+
+    authentication_classes = [CookieJWTAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def head(self, request, upload_id):
+        # The offset must include chunks acknowledged a moment ago.
+        use_primary()
+        upload = VideoUpload.objects.filter(
+            pk=upload_id, user=request.user).first()
+        if not upload:
+            return _tus_response(status_code=status.HTTP_404_NOT_FOUND)
+        return _tus_response(upload, status.HTTP_200_OK)
+
+    def patch(self, request, upload_id):
+        if request.content_type != "application/offset+octet-stream":
+            return _tus_response(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        try:
+            offset = int(request.headers["Upload-Offset"])
+            count = int(request.headers.get("Content-Length") or 0)
+        except (KeyError, ValueError):
+            return _tus_response(status_code=status.HTTP_400_BAD_REQUEST,
+                                 data={"detail": "Upload-Offset header is required."})
+
+        with transaction.atomic():
+            try:
+                upload = VideoUpload.objects.select_for_update(nowait=True).get(
+                    pk=upload_id, user=request.user)
+            except VideoUpload.DoesNotExist:
+                return _tus_response(status_code=status.HTTP_404_NOT_FOUND)
+            except DatabaseError:
+                return _tus_response(status_code=status.HTTP_423_LOCKED,
+                                     data={"detail": "Another chunk is being written."})
+
+            if upload.video_id or offset != upload.offset:
+                return _tus_response(upload, status.HTTP_409_CONFLICT)
+            if offset + count > upload.length:
+                return _tus_response(upload, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+            if count and not append_chunk(upload, request.stream, count):
+                return _tus_response(upload, status.HTTP_400_BAD_REQUEST,
+                                     {"detail": "Chunk was interrupted."})
+            if upload.is_complete:
+                # Hashing a multi-GB master must not hold the request or the row lock.
+                transaction.on_commit(lambda: enqueue(finish_upload, upload.id))
+
+        return _tus_response(upload)
@@ -0,0 +1,167 @@
+"""
+Content-addressed source masters and their shared HLS output.
+
+Every hashed source is stored once as a SourceAsset. With local storage
+its renditions live in ``videos/hls/<sha256>/`` and each title using it
+gets ``videos/<id>`` as a symlink into that directory, so all path-based
+lookups (manifests, segments, sendfile) keep working without a database
+query. Object storage has no links, so there each title gets a
+server-side copy of the renditions under ``videos/<id>/`` instead. The
+shared files are only removed once the last title referencing the asset
+is gone.
+"""
+import hashlib
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from .hls import video_prefix
+from .models import SourceAsset, Video, VideoRendition
+from .storage import get_media_storage
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(file):
+    """
+    Returns the SHA-256 of an uploaded file. Uses the digest computed while
+    the upload was received if available, otherwise streams the file.
+    """
+    digest = getattr(file, "sha256", None)
+    if digest:
+        return digest
+    sha256 = hashlib.sha256()
+    file.seek(0)
+    for chunk in file.chunks(HASH_CHUNK_SIZE):
+        sha256.update(chunk)
+    file.seek(0)
+    return sha256.hexdigest()
+
+
+def path_sha256(path):
+    """Streams a file from disk and returns its SHA-256."""
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def asset_hls_prefix(asset):
+    return f"videos/hls/{asset.sha256}"
+
+
+def get_or_create_asset(sha256, source_name):
+    """
+    Returns ``(asset, created)`` for a source hash. If another upload won
+    the race for the same hash, the existing asset is returned and the
+    caller's ``source_name`` is left for it to discard.
+    """
+    asset = SourceAsset.objects.filter(sha256=sha256).first()
+    if asset:
+        return asset, False
+    try:
+        with transaction.atomic():
+            return SourceAsset.objects.create(sha256=sha256, source=source_name), True
+    except IntegrityError:
+        return SourceAsset.objects.get(sha256=sha256), False
+
+
+def attach_uploaded_source(video, uploaded_file):
+    """
+    Points a not-yet-saved video at the asset for an uploaded file.
+    A known master is not stored a second time.
+    """
+    sha256 = file_sha256(uploaded_file)
+    asset = SourceAsset.objects.filter(sha256=sha256).first()
+    if asset is None:
+        name = default_storage.save(
+            video._meta.get_field("source").generate_filename(video, uploaded_file.name),
+            uploaded_file,
+        )
+        asset, created = get_or_create_asset(sha256, name)
+        if created:
+            get_media_storage().import_source(name)
+        else:
+            default_storage.delete(name)
+    video.asset = asset
+    video.source = asset.source.name
+
+
+def attach_stored_source(video, source_name, sha256):
+    """
+    Points a not-yet-saved video at the asset for a file already written to
+    storage and hashed, deleting that file if the same master is known.
+    """
+    asset, created = get_or_create_asset(sha256, source_name)
+    if created:
+        get_media_storage().import_source(source_name)
+    else:
+        default_storage.delete(source_name)
+    video.asset = asset
+    video.source = asset.source.name
+
+
+def link_video_to_asset(video):
+    """
+    Makes ``videos/<id>`` a symlink into the asset's shared HLS directory,
+    or with object storage copies the renditions of a sibling title.
+    Returns the id of another title already sharing the asset (whose
+    renditions exist or are being produced), or ``None`` if this video
+    is the first and has to be transcoded. Renditions a sibling is still
+    producing are copied when its transcode finishes.
+    """
+    storage = get_media_storage()
+    sibling_id = Video.objects.filter(asset=video.asset).exclude(
+        pk=video.pk).values_list("id", flat=True).first()
+    if storage.supports_links:
+        storage.link_prefix(asset_hls_prefix(video.asset), video_prefix(video.id))
+    elif sibling_id is not None:
+        storage.link_prefix(video_prefix(sibling_id), video_prefix(video.id))
+    return sibling_id
+
+
+def shared_video_ids(video_id):
+    """Returns the ids of all videos sharing a video's asset, itself included."""
+    asset_id = Video.objects.filter(pk=video_id).values_list("asset_id", flat=True).first()
+    if asset_id is None:
+        return [video_id]
+    return list(Video.objects.filter(asset_id=asset_id).values_list("id", flat=True))
+
+
+def sync_shared_renditions(video_id):
+    """Mirrors a video's rendition states onto every title sharing its asset."""
+    video = Video.objects.select_related("asset").get(pk=video_id)
+    if video.asset is None:
+        return
+    renditions = list(VideoRendition.objects.filter(video=video))
+    for sibling_id in Video.objects.filter(asset=video.asset).exclude(
+            pk=video_id).values_list("id", flat=True):
+        VideoRendition.objects.filter(video_id=sibling_id).exclude(
+            resolution__in=[r.resolution for r in renditions]).delete()
+        for rendition in renditions:
+            VideoRendition.objects.update_or_create(
+                video_id=sibling_id, resolution=rendition.resolution,
+                defaults={
+                    "status": rendition.status,
+                    "progress": rendition.progress,
+                    "started_at": rendition.started_at,
+                    "finished_at": rendition.finished_at,
+                    "duration_seconds": rendition.duration_seconds,
+                    "output_bytes": rendition.output_bytes,
+                    "error": rendition.error,
+                },
+            )
+
+
+def release_asset(asset):
+    """
+    Deletes an asset's source and shared HLS output once no title
+    references it any more.
+    """
+    if Video.objects.filter(asset=asset).exists():
+        return False
+    storage = get_media_storage()
+    storage.delete_prefix(asset_hls_prefix(asset))
+    if asset.source:
+        storage.delete(asset.source.name)
+    asset.delete()
+    return True
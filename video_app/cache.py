@@ -0,0 +1,61 @@
+"""
+Versioned Redis cache for serialized catalog pages.
+
+Every cached page key embeds the current catalog version. Bumping the
+version on any Video change makes all previously cached pages unreachable,
+so they simply expire instead of having to be deleted one by one.
+"""
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+
+CATALOG_VERSION_KEY = "video-catalog-version"
+CATALOG_CHANGED_KEY = "video-catalog-changed"
+
+
+def catalog_version():
+    """Returns the current catalog version, initialising it if needed."""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, 1, timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY, 1)
+    return version
+
+
+async def acatalog_version():
+    """Async variant of ``catalog_version()`` for async views."""
+    version = await cache.aget(CATALOG_VERSION_KEY)
+    if version is None:
+        await cache.aadd(CATALOG_VERSION_KEY, 1, timeout=None)
+        version = await cache.aget(CATALOG_VERSION_KEY, 1)
+    return version
+
+
+def bump_catalog_version():
+    """Invalidates all cached catalog pages."""
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.add(CATALOG_VERSION_KEY, 2, timeout=None)
+    if settings.DATABASE_REPLICAS:
+        # Replicas may still lag behind the change; see VideoListView.
+        cache.set(CATALOG_CHANGED_KEY, True, settings.DB_REPLICA_STICKY_SECONDS)
+
+
+def _page_digest(request):
+    return hashlib.sha1(
+        request.build_absolute_uri().encode("utf-8")).hexdigest()
+
+
+def catalog_page_key(request):
+    """
+    Builds the cache key for a catalog page request.
+    Host and query string are part of the key because the payload
+    contains absolute thumbnail and pagination URLs.
+    """
+    return f"video-catalog:{catalog_version()}:{_page_digest(request)}"
+
+
+async def acatalog_page_key(request):
+    """Async variant of ``catalog_page_key()`` for async views."""
+    return f"video-catalog:{await acatalog_version()}:{_page_digest(request)}"
@@ -0,0 +1,250 @@
+"""
+Helpers for HLS playlists: renditions in media storage, the in-process
+manifest cache and the multi-variant master playlist.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import http_date
+from .storage import get_media_storage
+
+LADDER = {
+    "480p": {
+        "height": 480,
+        "video_bitrate": "1400k",
+        "maxrate": "1500k",
+        "bufsize": "2100k",
+        "audio_bitrate": "96k",
+    },
+    "720p": {
+        "height": 720,
+        "video_bitrate": "2800k",
+        "maxrate": "3000k",
+        "bufsize": "4200k",
+        "audio_bitrate": "128k",
+    },
+    "1080p": {
+        "height": 1080,
+        "video_bitrate": "5000k",
+        "maxrate": "5350k",
+        "bufsize": "7500k",
+        "audio_bitrate": "192k",
+    },
+}
+RESOLUTIONS = list(LADDER)
+VARIANT_FILE = "variant.json"
+
+
+def video_prefix(video_id):
+    """Returns the storage prefix holding all renditions of a video."""
+    return f"videos/{video_id}"
+
+
+def rendition_prefix(video_id, resolution):
+    """Returns the storage prefix holding one rendition's playlist and segments."""
+    return f"{video_prefix(video_id)}/{resolution}"
+
+
+def manifest_name(video_id, resolution):
+    """Returns the storage name of a rendition's ``index.m3u8``."""
+    return f"{rendition_prefix(video_id, resolution)}/index.m3u8"
+
+
+def segment_name(video_id, resolution, segment):
+    return f"{rendition_prefix(video_id, resolution)}/{segment}"
+
+
+@dataclass(frozen=True)
+class CachedManifest:
+    """Manifest bytes together with their validators."""
+
+    body: bytes
+    mtime_ns: int
+    etag: str
+    last_modified: str
+    checked_at: float
+
+
+class ManifestCache:
+    """
+    Thread-safe LRU cache of manifest bytes keyed by (video id, resolution).
+
+    Entries are revalidated against the file's mtime at most once every
+    ``recheck`` seconds, so hot manifests are served without a syscall
+    (or, with object storage, without a HEAD request).
+    """
+
+    def __init__(self, max_entries=512, recheck=2.0):
+        self.max_entries = max_entries
+        self.recheck = recheck
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, video_id, resolution):
+        """Returns the cached manifest or ``None`` if it does not exist."""
+        key = (int(video_id), resolution)
+        now = time.monotonic()
+        entry = self._lookup(key)
+        if entry is not None and now - entry.checked_at < self.recheck:
+            return entry
+        return self._refresh(key, entry, now)
+
+    async def aget(self, video_id, resolution):
+        """
+        Async variant of ``get()``. Fresh entries are returned from memory;
+        a miss or recheck stats and reads media storage (a HEAD and GET
+        with object storage), so it runs in a thread.
+        """
+        key = (int(video_id), resolution)
+        now = time.monotonic()
+        entry = self._lookup(key)
+        if entry is not None and now - entry.checked_at < self.recheck:
+            return entry
+        return await asyncio.to_thread(self._refresh, key, entry, now)
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _refresh(self, key, entry, now):
+        entry = self._load(key, entry, now)
+
+        with self._lock:
+            if entry is None:
+                self._entries.pop(key, None)
+                return None
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def _load(self, key, entry, now):
+        storage = get_media_storage()
+        name = manifest_name(*key)
+        stat_result = storage.stat(name)
+        if stat_result is None:
+            return None
+        if entry is not None and entry.mtime_ns == stat_result.mtime_ns:
+            body = entry.body
+        else:
+            try:
+                body = storage.read(name)
+            except FileNotFoundError:
+                return None
+
+        return CachedManifest(
+            body=body,
+            mtime_ns=stat_result.mtime_ns,
+            etag=f'"{stat_result.mtime_ns:x}-{len(body):x}"',
+            last_modified=http_date(stat_result.mtime),
+            checked_at=now,
+        )
+
+    def invalidate(self, video_id):
+        """Drops every cached rendition of a video."""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == int(video_id)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+manifest_cache = ManifestCache(
+    max_entries=settings.VIDEO_MANIFEST_CACHE_SIZE,
+    recheck=settings.VIDEO_MANIFEST_RECHECK_SECONDS,
+)
+
+
+def read_variant(video_id, resolution):
+    """
+    Returns the stream attributes measured for a rendition at transcode
+    time, or ``None`` if the rendition is missing or was never measured.
+    """
+    storage = get_media_storage()
+    if not storage.exists(manifest_name(video_id, resolution)):
+        return None
+    try:
+        return json.loads(storage.read(
+            f"{rendition_prefix(video_id, resolution)}/{VARIANT_FILE}"))
+    except (OSError, ValueError):
+        return None
+
+
+def build_master_playlist(video_id):
+    """
+    Builds an ``EXT-X-STREAM-INF`` master playlist from the renditions
+    that exist in storage, lowest bandwidth first. Returns ``None`` if no
+    rendition is available.
+    """
+    variants = []
+    for resolution in RESOLUTIONS:
+        variant = read_variant(video_id, resolution)
+        if variant:
+            variants.append((resolution, variant))
+    if not variants:
+        return None
+
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-INDEPENDENT-SEGMENTS"]
+    for resolution, variant in sorted(variants, key=lambda v: v[1]["bandwidth"]):
+        attributes = [f"BANDWIDTH={variant['bandwidth']}"]
+        if variant.get("average_bandwidth"):
+            attributes.append(
+                f"AVERAGE-BANDWIDTH={variant['average_bandwidth']}")
+        if variant.get("width") and variant.get("height"):
+            attributes.append(
+                f"RESOLUTION={variant['width']}x{variant['height']}")
+        if variant.get("codecs"):
+            attributes.append(f'CODECS="{variant["codecs"]}"')
+        lines.append("#EXT-X-STREAM-INF:" + ",".join(attributes))
+        lines.append(f"{resolution}/index.m3u8")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def master_cache_key(video_id):
+    return f"video-master:{video_id}"
+
+
+def get_master_playlist(video_id):
+    """
+    Returns ``(body, etag)`` for a video's master playlist, served from the
+    shared cache when possible. Returns ``None`` if nothing is playable yet.
+    """
+    key = master_cache_key(video_id)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    body = build_master_playlist(video_id)
+    if body is None:
+        return None
+    cached = (body, f'"{hashlib.md5(body).hexdigest()}"')
+    cache.set(key, cached, settings.VIDEO_MASTER_CACHE_TIMEOUT)
+    return cached
+
+
+async def aget_master_playlist(video_id):
+    """
+    Async variant of ``get_master_playlist()``. Only a miss touches media
+    storage, which runs in a thread so the event loop is not blocked.
+    """
+    cached = await cache.aget(master_cache_key(video_id))
+    if cached is not None:
+        return cached
+    return await sync_to_async(get_master_playlist)(video_id)
+
+
+def invalidate_master_playlist(video_id):
+    cache.delete(master_cache_key(video_id))
@@ -0,0 +1,450 @@
+import json
+import os
+import random
+import secrets
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from http.client import HTTPConnection
+from http.cookies import SimpleCookie
+from urllib.parse import urlsplit
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from prometheus_client.parser import text_string_to_metric_families
+from video_app.cache import bump_catalog_version
+from video_app.hls import LADDER, VARIANT_FILE, rendition_prefix
+from video_app.models import RenditionStatus, Video, VideoRendition
+from video_app.storage import get_media_storage
+
+User = get_user_model()
+
+BENCH_DESCRIPTION = "Synthetic video seeded by bench_playback."
+BENCH_EMAIL_DOMAIN = "bench.invalid"
+BENCH_PASSWORD = "bench-playback-password"
+SEGMENT_SECONDS = 10
+KINDS = ("login", "list", "manifest", "segment", "refresh")
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a sorted list."""
+    if not samples:
+        return None
+    index = max(int(round(pct / 100 * len(samples) + 0.5)) - 1, 0)
+    return samples[min(index, len(samples) - 1)]
+
+
+class Stats:
+    """Latency samples, errors and bytes per request kind, shared by viewers."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def record(self, kind, elapsed, ok, size):
+        with self._lock:
+            self.latencies[kind].append(elapsed)
+            if not ok:
+                self.errors[kind] += 1
+            self.bytes += size
+
+
+class Viewer(threading.Thread):
+    """
+    One simulated user: logs in, lists the catalog, loads a manifest and
+    plays its segments in a loop until the deadline, refreshing the access
+    token periodically.
+    """
+
+    def __init__(self, host, port, email, stats, deadline, options):
+        super().__init__(daemon=True)
+        self.connection = HTTPConnection(host, port, timeout=60)
+        self.email = email
+        self.stats = stats
+        self.deadline = deadline
+        self.pace = options["pace"]
+        self.refresh_interval = options["refresh_interval"]
+        self.resolution = options["resolution"]
+        self.cookies = {}
+        self.failure = None
+
+    def request(self, kind, method, path, body=None):
+        headers = {}
+        if self.cookies:
+            headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+        if body is not None:
+            body = json.dumps(body)
+            headers["Content-Type"] = "application/json"
+
+        start = time.perf_counter()
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            data = response.read()
+        except OSError:
+            self.connection.close()
+            self.stats.record(kind, time.perf_counter() - start, False, 0)
+            raise
+        self.stats.record(kind, time.perf_counter() - start,
+                          response.status < 400, len(data))
+
+        for header in response.msg.get_all("Set-Cookie") or []:
+            cookie = SimpleCookie(header)
+            self.cookies.update({k: m.value for k, m in cookie.items()})
+        if response.status >= 400:
+            raise RuntimeError(f"{method} {path} returned {response.status}")
+        return data
+
+    def run(self):
+        try:
+            self.play()
+        except (OSError, RuntimeError, ValueError) as e:
+            self.failure = str(e)
+        finally:
+            self.connection.close()
+
+    def play(self):
+        self.request("login", "POST", "/api/login/",
+                     {"email": self.email, "password": BENCH_PASSWORD})
+        videos = [
+            video for video in json.loads(self.request("list", "GET", "/api/video/"))["results"]
+            if video["description"] == BENCH_DESCRIPTION
+        ]
+        if not videos:
+            raise RuntimeError("No seeded video on the first catalog page")
+        video = random.choice(videos)
+
+        base = f"/api/video/{video['id']}/{self.resolution}/"
+        manifest = self.request("manifest", "GET", base + "index.m3u8").decode()
+        segments = [line for line in manifest.splitlines()
+                    if line and not line.startswith("#")]
+        last_refresh = time.monotonic()
+
+        index = random.randrange(len(segments))
+        while time.monotonic() < self.deadline:
+            self.request("segment", "GET", base + segments[index % len(segments)])
+            index += 1
+            if time.monotonic() - last_refresh >= self.refresh_interval:
+                self.request("refresh", "POST", "/api/token/refresh/")
+                last_refresh = time.monotonic()
+            if self.pace:
+                time.sleep(self.pace)
+
+
+class Command(BaseCommand):
+    """
+    Load benchmark simulating concurrent HLS viewers end to end.
+
+    Seeds synthetic videos with generated ``.ts`` segments and benchmark
+    users, starts gunicorn locally (or targets ``--url``), drives N viewer
+    threads through login, list, manifest, segment playback and token
+    refresh, and reports throughput, latency percentiles and the DB queries
+    per request taken from ``/metrics``. Results can be saved as a JSON
+    baseline and compared against a previous one.
+    """
+
+    help = "Benchmark concurrent HLS playback against a running server."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=20)
+        parser.add_argument("--duration", type=float, default=30.0,
+                            help="Seconds of playback per viewer.")
+        parser.add_argument("--videos", type=int, default=10)
+        parser.add_argument("--segments", type=int, default=30,
+                            help="Segments per seeded video.")
+        parser.add_argument("--segment-size", type=int, default=512 * 1024)
+        parser.add_argument("--resolution", choices=list(LADDER), default="720p")
+        parser.add_argument("--pace", type=float, default=0.0,
+                            help="Seconds between segment requests (0 = as fast as possible).")
+        parser.add_argument("--refresh-interval", type=float, default=10.0,
+                            help="Seconds between token refreshes per viewer.")
+        parser.add_argument("--url", help="Target an already running server instead of starting one.")
+        parser.add_argument("--server-mode", choices=["wsgi", "asgi"], default="wsgi")
+        parser.add_argument("--workers", type=int, default=2)
+        parser.add_argument("--metrics-token", default=settings.METRICS_AUTH_TOKEN)
+        parser.add_argument("--save", help="Write the results as a JSON baseline to this path.")
+        parser.add_argument("--compare", help="Compare against a saved JSON baseline.")
+        parser.add_argument("--tolerance", type=float, default=10.0,
+                            help="Allowed p95/throughput regression in percent.")
+        parser.add_argument("--fail-on-regression", action="store_true")
+        parser.add_argument("--keep", action="store_true",
+                            help="Keep the seeded videos and users.")
+
+    def handle(self, *args, **options):
+        self.seed(options)
+        server = None
+        try:
+            if options["url"]:
+                parts = urlsplit(options["url"])
+                host, port = parts.hostname, parts.port or 80
+            else:
+                host, port = "127.0.0.1", self.free_port()
+                server = self.start_server(port, options)
+            self.metrics_token = server.metrics_token if server else options["metrics_token"]
+            before = self.scrape_queries(host, port)
+            stats, elapsed, failures = self.run_viewers(host, port, options)
+            after = self.scrape_queries(host, port)
+        finally:
+            if server:
+                server.terminate()
+                server.wait(timeout=30)
+                shutil.rmtree(server.metrics_dir, ignore_errors=True)
+            if not options["keep"]:
+                self.cleanup()
+
+        results = self.summarize(stats, elapsed, before, after, options)
+        self.report(results, failures)
+        if options["save"]:
+            with open(options["save"], "w") as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Saved baseline to {options['save']}")
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                regressions = self.compare(json.load(f), results, options["tolerance"])
+            if regressions and options["fail_on_regression"]:
+                raise CommandError(f"{regressions} metric(s) regressed")
+
+    # Seeding -----------------------------------------------------------
+
+    def seed(self, options):
+        """Creates benchmark users and videos with a ready rendition in media storage."""
+        password = make_password(BENCH_PASSWORD)
+        emails = [f"viewer{i}@{BENCH_EMAIL_DOMAIN}" for i in range(options["users"])]
+        User.objects.bulk_create(
+            [User(username=email, email=email, password=password, is_active=True)
+             for email in emails],
+            ignore_conflicts=True,
+        )
+        self.emails = emails
+
+        existing = Video.objects.filter(description=BENCH_DESCRIPTION).count()
+        resolution = options["resolution"]
+        payload = os.urandom(options["segment_size"])
+        for i in range(existing, options["videos"]):
+            video = Video.objects.create(title=f"Benchmark {i}", description=BENCH_DESCRIPTION)
+            storage = get_media_storage()
+            with storage.output_dir([rendition_prefix(video.id, resolution)]) as directory:
+                lines = ["#EXTM3U", "#EXT-X-VERSION:3",
+                         f"#EXT-X-TARGETDURATION:{SEGMENT_SECONDS}",
+                         "#EXT-X-MEDIA-SEQUENCE:0", "#EXT-X-PLAYLIST-TYPE:VOD"]
+                for n in range(options["segments"]):
+                    with open(os.path.join(directory, f"index{n}.ts"), "wb") as f:
+                        f.write(payload)
+                    lines += [f"#EXTINF:{SEGMENT_SECONDS:.6f},", f"index{n}.ts"]
+                lines.append("#EXT-X-ENDLIST")
+                with open(os.path.join(directory, "index.m3u8"), "w") as f:
+                    f.write("\n".join(lines) + "\n")
+
+                bandwidth = len(payload) * 8 // SEGMENT_SECONDS
+                height = LADDER[resolution]["height"]
+                with open(os.path.join(directory, VARIANT_FILE), "w") as f:
+                    json.dump({"bandwidth": bandwidth, "average_bandwidth": bandwidth,
+                               "width": height * 16 // 9, "height": height,
+                               "codecs": "avc1.64001f,mp4a.40.2"}, f)
+            VideoRendition.objects.create(
+                video=video, resolution=resolution, status=RenditionStatus.READY,
+                progress=100, output_bytes=len(payload) * options["segments"])
+        # Renditions decide catalog membership; drop pages cached before they existed.
+        bump_catalog_version()
+        self.stdout.write(
+            f"Seeded {options['videos']} videos and {len(emails)} users.")
+
+    def cleanup(self):
+        for video in Video.objects.filter(description=BENCH_DESCRIPTION):
+            video.delete()
+        User.objects.filter(email__endswith=f"@{BENCH_EMAIL_DOMAIN}").delete()
+
+    # Server ------------------------------------------------------------
+
+    @staticmethod
+    def free_port():
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            return s.getsockname()[1]
+
+    def start_server(self, port, options):
+        """
+        Starts gunicorn with throttling relaxed for the benchmark users, a
+        private multiprocess metrics directory and a one-off metrics token,
+        and waits until it answers.
+        """
+        metrics_dir = tempfile.mkdtemp(prefix="bench-metrics-")
+        metrics_token = secrets.token_urlsafe(32)
+        env = dict(
+            os.environ,
+            PROMETHEUS_MULTIPROC_DIR=metrics_dir,
+            METRICS_AUTH_TOKEN=metrics_token,
+            THROTTLE_LOGIN_IP="1000000/m",
+            THROTTLE_LOGIN_ACCOUNT="1000000/m",
+        )
+        app = "core.asgi:application" if options["server_mode"] == "asgi" else "core.wsgi:application"
+        command = [sys.executable, "-m", "gunicorn", app,
+                   "--bind", f"127.0.0.1:{port}", "--workers", str(options["workers"]),
+                   "--log-level", "warning"]
+        if options["server_mode"] == "asgi":
+            command += ["--worker-class", "uvicorn_worker.UvicornWorker"]
+
+        server = subprocess.Popen(command, cwd=settings.BASE_DIR, env=env)
+        server.metrics_dir = metrics_dir
+        server.metrics_token = metrics_token
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError("The benchmark server exited during startup")
+            try:
+                with socket.create_connection(("127.0.0.1", port), timeout=1):
+                    return server
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError("The benchmark server did not start within 30s")
+
+    def scrape_queries(self, host, port):
+        """Returns ``{view: (query_sum, request_count)}`` from ``/metrics``."""
+        connection = HTTPConnection(host, port, timeout=30)
+        headers = {"Authorization": f"Bearer {self.metrics_token}"} if self.metrics_token else {}
+        try:
+            connection.request("GET", "/metrics", headers=headers)
+            response = connection.getresponse()
+            body = response.read().decode()
+        except OSError as e:
+            raise CommandError(f"Could not scrape /metrics: {e}")
+        finally:
+            connection.close()
+        if response.status != 200:
+            # Without the numbers the query columns would silently read 0.
+            raise CommandError(
+                f"/metrics answered {response.status}; pass --metrics-token "
+                f"matching the server's METRICS_AUTH_TOKEN")
+
+        totals = defaultdict(lambda: [0.0, 0.0])
+        for family in text_string_to_metric_families(body):
+            if family.name != "videoflix_http_db_queries":
+                continue
+            for sample in family.samples:
+                view = sample.labels.get("view")
+                if sample.name.endswith("_sum"):
+                    totals[view][0] += sample.value
+                elif sample.name.endswith("_count"):
+                    totals[view][1] += sample.value
+        return dict(totals)
+
+    # Load --------------------------------------------------------------
+
+    def run_viewers(self, host, port, options):
+        stats = Stats()
+        deadline = time.monotonic() + options["duration"]
+        viewers = [Viewer(host, port, email, stats, deadline, options)
+                   for email in self.emails]
+        start = time.perf_counter()
+        for viewer in viewers:
+            viewer.start()
+        for viewer in viewers:
+            viewer.join()
+        failures = [v.failure for v in viewers if v.failure]
+        return stats, time.perf_counter() - start, failures
+
+    # Reporting ---------------------------------------------------------
+
+    def summarize(self, stats, elapsed, before, after, options):
+        endpoints = {}
+        total_requests = 0
+        for kind in KINDS:
+            samples = sorted(stats.latencies.get(kind, []))
+            total_requests += len(samples)
+            endpoints[kind] = {
+                "requests": len(samples),
+                "errors": stats.errors.get(kind, 0),
+                "rps": round(len(samples) / elapsed, 2),
+                **{f"p{p}_ms": round(percentile(samples, p) * 1000, 2) if samples else None
+                   for p in (50, 95, 99)},
+            }
+
+        queries = {}
+        for view, (query_sum, count) in after.items():
+            old_sum, old_count = before.get(view, (0.0, 0.0))
+            if count > old_count:
+                queries[view] = round((query_sum - old_sum) / (count - old_count), 2)
+
+        try:
+            revision = subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            revision = None
+
+        return {
+            "meta": {
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "revision": revision,
+                "users": options["users"],
+                "duration": options["duration"],
+                "server_mode": options["server_mode"] if not options["url"] else None,
+                "workers": options["workers"] if not options["url"] else None,
+                "segment_size": options["segment_size"],
+                "pace": options["pace"],
+            },
+            "throughput": {
+                "requests_per_second": round(total_requests / elapsed, 2),
+                "mib_per_second": round(stats.bytes / elapsed / 1024 / 1024, 2),
+            },
+            "endpoints": endpoints,
+            "queries_per_request": queries,
+        }
+
+    def report(self, results, failures):
+        throughput = results["throughput"]
+        self.stdout.write(
+            f"\n{throughput['requests_per_second']:.1f} req/s, "
+            f"{throughput['mib_per_second']:.1f} MiB/s")
+        self.stdout.write(f"{'endpoint':<10} {'requests':>9} {'errors':>7} {'req/s':>9} "
+                          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        for kind, row in results["endpoints"].items():
+            cells = [f"{row[k]:>9.2f}" if row[k] is not None else f"{'-':>9}"
+                     for k in ("p50_ms", "p95_ms", "p99_ms")]
+            self.stdout.write(f"{kind:<10} {row['requests']:>9} {row['errors']:>7} "
+                              f"{row['rps']:>9.1f} " + " ".join(cells))
+        if results["queries_per_request"]:
+            self.stdout.write("\nDB queries per request:")
+            for view, value in sorted(results["queries_per_request"].items()):
+                self.stdout.write(f"  {view:<28} {value:>6.2f}")
+        if failures:
+            self.stderr.write(f"\n{len(failures)} viewer(s) stopped early, e.g.: {failures[0]}")
+
+    def compare(self, baseline, results, tolerance):
+        """
+        Prints overall throughput, per-endpoint p95 and query count changes
+        against a baseline; returns the number of regressions.
+        """
+        regressions = 0
+
+        def line(label, change, regressed):
+            nonlocal regressions
+            regressions += regressed
+            self.stdout.write(f"  {label:<28} {change}" + ("  REGRESSION" if regressed else ""))
+
+        self.stdout.write(f"\nCompared with {baseline['meta'].get('revision') or 'baseline'}:")
+        for key, old in baseline.get("throughput", {}).items():
+            new = results["throughput"].get(key)
+            if old and new is not None:
+                change = (new - old) / old * 100
+                line(key, f"{change:+7.1f}%", change < -tolerance)
+        for kind, row in results["endpoints"].items():
+            old = baseline.get("endpoints", {}).get(kind, {}).get("p95_ms")
+            if old and row["p95_ms"] is not None:
+                change = (row["p95_ms"] - old) / old * 100
+                line(f"{kind} p95", f"{change:+7.1f}%", change > tolerance)
+        for view, value in sorted(results["queries_per_request"].items()):
+            old = baseline.get("queries_per_request", {}).get(view)
+            if old is not None and value != old:
+                line(f"{view} queries", f"{old} -> {value}", value > old)
+        return regressions
@@ -0,0 +1,81 @@
+import os
+import tempfile
+import time
+from django.core.management.base import BaseCommand
+from django.http import FileResponse
+from django.test import RequestFactory, override_settings
+from video_app.api.streaming import serve_file
+from video_app.segment_cache import SharedSegmentCache
+
+
+class Command(BaseCommand):
+    """
+    Compares segment delivery throughput of the plain FileResponse path
+    against ranged responses, the shared segment cache and the sendfile
+    offload mode.
+    """
+
+    help = "Benchmark HLS segment delivery paths."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size", type=int, default=2 * 1024 * 1024,
+                            help="Segment size in bytes.")
+        parser.add_argument("--requests", type=int, default=500,
+                            help="Requests per scenario.")
+
+    def handle(self, *args, **options):
+        size = options["size"]
+        count = options["requests"]
+        factory = RequestFactory()
+
+        with tempfile.TemporaryDirectory() as media_root, \
+                tempfile.TemporaryDirectory() as cache_dir:
+            path = os.path.join(media_root, "segment0.ts")
+            with open(path, "wb") as f:
+                f.write(os.urandom(size))
+
+            def file_response(request):
+                return FileResponse(open(path, "rb"), content_type="video/MP2T")
+
+            def ranged(request):
+                return serve_file(request, path, "video/MP2T")
+
+            cache = SharedSegmentCache(cache_dir, max(size * 8, 64 * 1024 ** 2))
+
+            def cached(request):
+                return serve_file(request, path, "video/MP2T", cache=cache)
+
+            full = factory.get("/")
+            half = factory.get("/", HTTP_RANGE=f"bytes={size // 2}-")
+
+            scenarios = [
+                ("FileResponse (current)", file_response, full),
+                ("serve_file full", ranged, full),
+                ("serve_file range", ranged, half),
+                ("serve_file cached", cached, full),
+                ("serve_file cached range", cached, half),
+            ]
+            for name, view, request in scenarios:
+                self._run(name, view, request, count)
+
+            with override_settings(VIDEO_SENDFILE_MODE="nginx",
+                                   MEDIA_ROOT=media_root):
+                self._run("serve_file offload", ranged, full, count)
+
+    def _run(self, name, view, request, count):
+        sent = 0
+        start = time.perf_counter()
+        for _ in range(count):
+            response = view(request)
+            if response.streaming:
+                for chunk in response.streaming_content:
+                    sent += len(chunk)
+            else:
+                sent += len(response.content)
+            response.close()
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(
+            f"{name:<24} {count / elapsed:10.1f} req/s "
+            f"{sent / elapsed / 1024 / 1024:10.1f} MiB/s"
+        )
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.10 on 2026-10-18 19:09
+
+import os
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_renditions(apps, schema_editor):
+    """Marks renditions already transcoded on disk as ready."""
+    Video = apps.get_model("video_app", "Video")
+    VideoRendition = apps.get_model("video_app", "VideoRendition")
+    renditions = []
+    for video_id in Video.objects.values_list("id", flat=True):
+        for resolution in ("480p", "720p", "1080p"):
+            manifest = os.path.join(
+                settings.MEDIA_ROOT, "videos", str(video_id), resolution, "index.m3u8")
+            if os.path.exists(manifest):
+                renditions.append(VideoRendition(
+                    video_id=video_id, resolution=resolution,
+                    status="ready", progress=100))
+    VideoRendition.objects.bulk_create(renditions)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video_app', '0004_video_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VideoRendition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(max_length=10)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('progress', models.FloatField(default=0)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('duration_seconds', models.FloatField(blank=True, null=True)),
+                ('output_bytes', models.BigIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('video', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='renditions', to='video_app.video')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'video'], name='rendition_status_video_idx')],
+                'constraints': [models.UniqueConstraint(fields=('video', 'resolution'), name='unique_video_rendition')],
+            },
+        ),
+        migrations.RunPython(backfill_renditions, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,12 @@
+import uuid
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
 
+# Text search configuration of the stored search vector; queries must use it too.
+SEARCH_CONFIG = "english"
+
 
 class VideoCategory(models.TextChoices):
     """Enumeration of possible video categories."""
@@ -13,6 +20,20 @@ class VideoCategory(models.TextChoices):
     OTHER = "Other", "Other"
 
 
+class SourceAsset(models.Model):
+    """
+    A unique source master, identified by the SHA-256 of its bytes.
+    Videos uploaded from the same master share its file and HLS output.
+    """
+
+    sha256 = models.CharField(max_length=64, unique=True)
+    source = models.FileField(upload_to="videos/source/")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.sha256
+
+
 class Video(models.Model):
     """Model representing a video uploaded by a user."""
 
@@ -30,12 +51,38 @@ class Video(models.Model):
         blank=False,   # required
         null=False
     )
+    # Resized derivatives of ``thumbnail``, see ``tasks.generate_thumbnails``:
+    # {"source": <thumbnail name>, "<format>": {"<width>": <file name>}}
+    thumbnails = models.JSONField(default=dict, blank=True)
     category = models.CharField(
         max_length=50,
         choices=VideoCategory.choices,
         default=VideoCategory.OTHER
     )
+    asset = models.ForeignKey(
+        SourceAsset,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name="videos"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
+    # Full-text document, title weighted over description; kept current by Postgres.
+    search_vector = models.GeneratedField(
+        expression=SearchVector("title", weight="A", config=SEARCH_CONFIG)
+        + SearchVector("description", weight="B", config=SEARCH_CONFIG),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-created_at", "-id"],
+                         name="video_created_id_idx"),
+            models.Index(fields=["category", "-created_at", "-id"],
+                         name="video_category_created_idx"),
+            GinIndex(fields=["search_vector"], name="video_search_vector_idx"),
+        ]
 
     def __str__(self):
         return self.title
@@ -46,3 +93,86 @@ class Video(models.Model):
         if self.thumbnail:
             return self.thumbnail.url
         return None
+
+
+class RenditionStatus(models.TextChoices):
+    """Enumeration of transcode states of a rendition."""
+
+    PENDING = "pending", "Pending"
+    RUNNING = "running", "Running"
+    READY = "ready", "Ready"
+    FAILED = "failed", "Failed"
+
+
+class VideoRendition(models.Model):
+    """One rung of a video's HLS ladder and the state of its transcode job."""
+
+    video = models.ForeignKey(
+        Video,
+        on_delete=models.CASCADE,
+        related_name="renditions"
+    )
+    resolution = models.CharField(max_length=10)
+    status = models.CharField(
+        max_length=10,
+        choices=RenditionStatus.choices,
+        default=RenditionStatus.PENDING
+    )
+    progress = models.FloatField(default=0)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    duration_seconds = models.FloatField(null=True, blank=True)
+    output_bytes = models.BigIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["video", "resolution"],
+                                    name="unique_video_rendition"),
+        ]
+        indexes = [
+            models.Index(fields=["status", "video"],
+                         name="rendition_status_video_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.video_id} {self.resolution} ({self.status})"
+
+
+class VideoUpload(models.Model):
+    """
+    A resumable source upload. Chunks are appended to ``path`` until
+    ``offset`` reaches ``length``, then the Video is created.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="video_uploads"
+    )
+    path = models.CharField(max_length=255)
+    length = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    title = models.CharField(max_length=255)
+    description = models.TextField(blank=True)
+    category = models.CharField(
+        max_length=50,
+        choices=VideoCategory.choices,
+        default=VideoCategory.OTHER
+    )
+    video = models.OneToOneField(
+        Video,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="upload"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.title} ({self.offset}/{self.length})"
+
+    @property
+    def is_complete(self):
+        return self.offset >= self.length
@@ -0,0 +1,170 @@
+"""
+Readahead of upcoming HLS segments.
+
+Playback is sequential, so when segment ``k`` is served the next
+``VIDEO_PREFETCH_SEGMENTS`` segments are handed to the kernel with
+``posix_fadvise(POSIX_FADV_WILLNEED)``, and serving a manifest warms the
+first ones. The advice is given by one background thread per process
+from a bounded queue, and at most ``VIDEO_PREFETCH_CONCURRENCY`` threads
+per node advise at the same time (``flock`` slots in
+``VIDEO_PREFETCH_LOCK_DIR``). Work that does not fit is dropped: readahead
+is a hint and must never compete with requests for the disk.
+"""
+import fcntl
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from core.metrics import SEGMENT_PREFETCH
+from .hls import rendition_prefix
+from .segment_cache import SEGMENT_INDEX_RE
+from .storage import get_media_storage
+
+logger = logging.getLogger(__name__)
+
+HAS_FADVISE = hasattr(os, "posix_fadvise")
+
+
+def next_segment_names(segment, count):
+    """Returns the names of the ``count`` segments following ``segment``."""
+    match = SEGMENT_INDEX_RE.search(segment)
+    if not match:
+        return []
+    digits = match.group(1)
+    head, tail = segment[:match.start(1)], segment[match.end(1):]
+    # Keep zero padding, e.g. seg_09.ts -> seg_10.ts.
+    return [f"{head}{int(digits) + offset:0{len(digits)}d}{tail}"
+            for offset in range(1, count + 1)]
+
+
+def manifest_segment_names(body, count):
+    """Returns the first ``count`` segment URIs of a media playlist."""
+    names = []
+    for line in body.decode("utf-8", "replace").splitlines():
+        if line and not line.startswith("#"):
+            names.append(line.split("?")[0])
+            if len(names) == count:
+                break
+    return names
+
+
+class SegmentPrefetcher:
+    """
+    Issues readahead for segment files in a background thread.
+
+    Files advised within the last ``remember`` seconds are skipped, so a
+    popular title does not queue the same readahead for every viewer.
+    """
+
+    def __init__(self, lock_dir, concurrency, queue_size=256, remember=30.0):
+        self.lock_dir = str(lock_dir)
+        self.concurrency = concurrency
+        self.remember = remember
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()
+        self._slots = []
+        self._pid = None
+
+    @property
+    def enabled(self):
+        return HAS_FADVISE and self.concurrency > 0
+
+    def prefetch(self, directory, names):
+        """Queues readahead of ``names`` in ``directory``; never blocks."""
+        if not self.enabled or not names:
+            return
+        now = time.monotonic()
+        paths = []
+        with self._lock:
+            for name in names:
+                path = os.path.join(directory, name)
+                advised = self._recent.get(path)
+                if advised is not None and now - advised < self.remember:
+                    continue
+                self._recent[path] = now
+                self._recent.move_to_end(path)
+                paths.append(path)
+            while len(self._recent) > 4096:
+                self._recent.popitem(last=False)
+        if not paths:
+            return
+        self._start()
+        try:
+            self._queue.put_nowait(paths)
+        except queue.Full:
+            SEGMENT_PREFETCH.labels("dropped").inc(len(paths))
+
+    def _start(self):
+        # A forked worker inherits neither the thread nor usable lock files.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            try:
+                os.makedirs(self.lock_dir, exist_ok=True)
+                self._slots = [
+                    os.open(os.path.join(self.lock_dir, f"slot{i}"), os.O_RDWR | os.O_CREAT, 0o600)
+                    for i in range(self.concurrency)
+                ]
+            except OSError as e:
+                logger.warning(f"Segment prefetch is not limited per node, {self.lock_dir} is unusable: {e}")
+                self._slots = []
+            self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            threading.Thread(target=self._run, name="segment-prefetch", daemon=True).start()
+            self._pid = os.getpid()
+
+    def _acquire_slot(self):
+        if not self._slots:
+            return -1
+        for fd in self._slots:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                continue
+        return None
+
+    def _run(self):
+        while True:
+            paths = self._queue.get()
+            slot = self._acquire_slot()
+            if slot is None:
+                SEGMENT_PREFETCH.labels("dropped").inc(len(paths))
+                continue
+            try:
+                for path in paths:
+                    self._advise(path)
+            finally:
+                if slot >= 0:
+                    fcntl.flock(slot, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _advise(path):
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            SEGMENT_PREFETCH.labels("advised").inc()
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+
+prefetcher = SegmentPrefetcher(
+    settings.VIDEO_PREFETCH_LOCK_DIR, settings.VIDEO_PREFETCH_CONCURRENCY)
+
+
+def prefetch_segments(video_id, resolution, names):
+    """Queues readahead for segments of a rendition in local storage."""
+    storage = get_media_storage()
+    if storage.redirects_downloads or not names:
+        return
+    prefetcher.prefetch(storage.path(rendition_prefix(video_id, resolution)), names)
@@ -0,0 +1,244 @@
+"""
+Node-wide cache of hot HLS segments in shared memory.
+
+Entries are files in a tmpfs directory (``VIDEO_SEGMENT_CACHE_DIR``) shared
+by every gunicorn and RQ worker process on the node. A process maps an
+entry once and serves later hits straight from the mapping, without
+opening or reading the segment. Entries are keyed by the segment's device,
+inode, mtime and size, so a re-encoded segment never hits a stale entry
+and titles linked to the same renditions share entries.
+
+Eviction is LRU within ``VIDEO_SEGMENT_CACHE_BYTES``. The first
+``VIDEO_SEGMENT_CACHE_PIN_SEGMENTS`` segments of a rendition are pinned:
+they are loaded when a transcode finishes and only evicted once no
+unpinned entry is left to make room.
+"""
+import fcntl
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from django.conf import settings
+from core.metrics import SEGMENT_CACHE_EVICTIONS, SEGMENT_CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_INDEX_RE = re.compile(r"(\d+)\.ts$")
+CONTROL_FILE = ".control"
+PIN_SUFFIX = ".pin"
+
+
+def is_pinned_segment(segment):
+    """Tells whether a segment is among the first ones of its rendition."""
+    match = SEGMENT_INDEX_RE.search(segment)
+    return bool(match) and int(match.group(1)) < settings.VIDEO_SEGMENT_CACHE_PIN_SEGMENTS
+
+
+class SharedSegmentCache:
+    """
+    Segment bytes shared by all processes on a node.
+
+    Inserts and evictions are serialised with an ``flock`` on the control
+    file, which also holds a generation counter bumped on every eviction.
+    Processes compare it on each hit and drop mappings of evicted entries,
+    so the byte budget holds across processes. Hits refresh the entry's
+    mtime, at most once every ``touch_interval`` seconds per process.
+    """
+
+    def __init__(self, directory, max_bytes, max_mappings=1024, touch_interval=5.0):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_bytes // 8
+        self.max_mappings = max_mappings
+        self.touch_interval = touch_interval
+        self._mappings = OrderedDict()
+        self._lock = threading.Lock()
+        self._control = None
+        self._pid = None
+        self._generation = 0
+        self._disabled = max_bytes <= 0
+
+    @property
+    def enabled(self):
+        return not self._disabled and self._open_control()
+
+    def _open_control(self):
+        # flock() is per open file, so a forked child needs its own descriptor.
+        if self._pid == os.getpid():
+            return True
+        with self._lock:
+            if self._pid == os.getpid():
+                return True
+            self._mappings.clear()
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                fd = os.open(os.path.join(self.directory, CONTROL_FILE), os.O_RDWR | os.O_CREAT, 0o600)
+                try:
+                    if os.fstat(fd).st_size < 8:
+                        os.ftruncate(fd, 8)
+                    self._control_fd = fd
+                    self._control = mmap.mmap(fd, 8)
+                except OSError:
+                    os.close(fd)
+                    raise
+            except OSError as e:
+                logger.warning(f"Segment cache disabled, {self.directory} is unusable: {e}")
+                self._disabled = True
+                return False
+            self._generation = self._read_generation()
+            self._pid = os.getpid()
+        return True
+
+    def _read_generation(self):
+        return struct.unpack_from("Q", self._control)[0]
+
+    @contextmanager
+    def _exclusive(self):
+        fcntl.flock(self._control_fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._control_fd, fcntl.LOCK_UN)
+
+    @staticmethod
+    def entry_name(stat_result, pinned=False):
+        name = (f"{stat_result.st_dev:x}-{stat_result.st_ino:x}-"
+                f"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}")
+        return name + PIN_SUFFIX if pinned else name
+
+    def get(self, stat_result, pinned=False):
+        """Returns a cached segment as a memoryview, or ``None`` on a miss."""
+        if not self.enabled or stat_result.st_size > self.max_entry_bytes:
+            return None
+        name = self.entry_name(stat_result, pinned)
+        self._drop_evicted()
+
+        with self._lock:
+            entry = self._mappings.get(name)
+            if entry is not None:
+                self._mappings.move_to_end(name)
+        if entry is None:
+            entry = self._map(name)
+        if entry is None:
+            SEGMENT_CACHE_REQUESTS.labels("miss").inc()
+            return None
+
+        view, touched = entry
+        now = time.monotonic()
+        if now - touched >= self.touch_interval:
+            try:
+                os.utime(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            with self._lock:
+                if name in self._mappings:
+                    self._mappings[name] = (view, now)
+        SEGMENT_CACHE_REQUESTS.labels("hit").inc()
+        return view
+
+    def _map(self, name):
+        try:
+            with open(os.path.join(self.directory, name), "rb") as f:
+                view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        except (OSError, ValueError):
+            return None
+        entry = (view, 0.0)
+        with self._lock:
+            self._mappings[name] = entry
+            while len(self._mappings) > self.max_mappings:
+                self._mappings.popitem(last=False)
+        return entry
+
+    def _drop_evicted(self):
+        generation = self._read_generation()
+        if generation == self._generation:
+            return
+        self._generation = generation
+        with self._lock:
+            for name in list(self._mappings):
+                if not os.path.exists(os.path.join(self.directory, name)):
+                    del self._mappings[name]
+
+    def load(self, path, stat_result, pinned=False):
+        """
+        Reads a segment into the cache and returns its bytes, or ``None``
+        if it is too large to cache or changed while being read.
+        """
+        if not self.enabled or stat_result.st_size > self.max_entry_bytes:
+            return None
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) != stat_result.st_size:
+            return None
+        self.store(self.entry_name(stat_result, pinned), data)
+        return data
+
+    def store(self, name, data):
+        final = os.path.join(self.directory, name)
+        temporary = f"{final}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with self._exclusive():
+            if os.path.exists(final):
+                return
+            self._make_room(len(data))
+            try:
+                with open(temporary, "wb") as f:
+                    f.write(data)
+                os.replace(temporary, final)
+            except OSError as e:
+                # A full tmpfs only costs the cache entry, never the request.
+                if os.path.exists(temporary):
+                    os.remove(temporary)
+                logger.warning(f"Could not cache segment in {self.directory}: {e}")
+
+    def _make_room(self, size):
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name == CONTROL_FILE or entry.name.endswith(".tmp"):
+                    continue
+                stat_result = entry.stat()
+                total += stat_result.st_size
+                entries.append((entry.name.endswith(PIN_SUFFIX), stat_result.st_mtime,
+                                stat_result.st_size, entry.path))
+        if total + size <= self.max_bytes:
+            return
+
+        evicted = 0
+        for _, _, entry_size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= entry_size
+            evicted += 1
+            if total + size <= self.max_bytes:
+                break
+        struct.pack_into("Q", self._control, 0, self._read_generation() + 1)
+        SEGMENT_CACHE_EVICTIONS.inc(evicted)
+
+    def pin_rendition(self, directory, segments):
+        """Loads the first pinned segments of a freshly encoded rendition."""
+        if not self.enabled:
+            return
+        for segment in segments:
+            if not is_pinned_segment(segment):
+                continue
+            path = os.path.join(directory, segment)
+            try:
+                stat_result = os.stat(path)
+            except OSError:
+                continue
+            self.load(path, stat_result, pinned=True)
+
+
+segment_cache = SharedSegmentCache(
+    settings.VIDEO_SEGMENT_CACHE_DIR, settings.VIDEO_SEGMENT_CACHE_BYTES)
@@ -1,27 +1,73 @@
+from django.db import transaction
 from django.db.models.signals import post_save,post_delete
 from django.dispatch import receiver
 from .models import Video
-from .tasks import convert_resolutions
-import django_rq
+from .tasks import convert_resolutions, generate_thumbnails, thumbnail_dir
+from .hls import manifest_cache, invalidate_master_playlist, video_prefix
+from .cache import bump_catalog_version
+from .assets import link_video_to_asset, release_asset, sync_shared_renditions
+from .storage import get_media_storage
+from core.queues import enqueue
 from django.conf import settings
 import shutil
 import os
 
 @receiver(post_save, sender=Video)
 def process_video_on_upload(sender, instance, created, **kwargs):
-    """Trigger HLS transcoding as a background task whenever a new video is uploaded."""
+    """
+    Trigger HLS transcoding as a background task whenever a new video is uploaded.
+    Videos whose source master is already known reuse the shared renditions instead.
+    The job is enqueued on commit, so the worker always sees the video row.
+    """
+    if created and instance.asset_id:
+        sibling_id = link_video_to_asset(instance)
+        if sibling_id is not None:
+            sync_shared_renditions(sibling_id)
+            return
     if created and instance.source:
-        queue = django_rq.get_queue("default", autocommit=True)
-        queue.enqueue(convert_resolutions, instance.id, instance.source.path)
+        video_id, source = instance.id, instance.source.name
+        transaction.on_commit(lambda: enqueue(convert_resolutions, video_id, source))
+
+
+@receiver(post_save, sender=Video)
+def process_thumbnail_on_change(sender, instance, **kwargs):
+    """
+    Render resized thumbnail variants in the background whenever the thumbnail changes.
+    Like the transcode, the job is enqueued on commit.
+    """
+    if instance.thumbnail and instance.thumbnails.get("source") != instance.thumbnail.name:
+        video_id = instance.id
+        transaction.on_commit(lambda: enqueue(generate_thumbnails, video_id))
 
 
 @receiver(post_delete, sender=Video)
 def cleanup_video_files(sender, instance, **kwargs):
-    """Delete the video source, thumbnail, and all generated HLS files when a Video instance is deleted."""
-    for file in [instance.source, instance.thumbnail]:
-        if file and os.path.isfile(file.path):
-            os.remove(file.path)
-
-    hls_dir = os.path.join(settings.MEDIA_ROOT, "videos", str(instance.id))
-    if os.path.isdir(hls_dir):
-        shutil.rmtree(hls_dir)
\ No newline at end of file
+    """
+    Delete the video source, thumbnail, and all generated HLS files when a Video instance is deleted.
+    Shared sources and renditions are only deleted with the last video referencing them.
+    """
+    storage = get_media_storage()
+    if instance.source and not instance.asset_id:
+        storage.delete(instance.source.name)
+    if instance.thumbnail and os.path.isfile(instance.thumbnail.path):
+        os.remove(instance.thumbnail.path)
+
+    derived_dir = os.path.join(settings.MEDIA_ROOT, thumbnail_dir(instance.id))
+    if os.path.isdir(derived_dir):
+        shutil.rmtree(derived_dir)
+
+    storage.delete_prefix(video_prefix(instance.id))
+    if instance.asset_id:
+        release_asset(instance.asset)
+    manifest_cache.invalidate(instance.id)
+    invalidate_master_playlist(instance.id)
+
+
+@receiver([post_save, post_delete], sender=Video)
+def invalidate_catalog_cache(sender, **kwargs):
+    """
+    Bump the catalog version so cached video list pages are never served stale.
+    The bump waits for the commit; a request rebuilding a page in between
+    would otherwise cache the old rows under the new version.
+    """
+    transaction.on_commit(bump_catalog_version)
@@ -0,0 +1,244 @@
+"""
+Storage for source masters and HLS output.
+
+Everything the video pipeline reads or writes goes through ``media_storage``,
+addressed by names relative to the storage root (``videos/<id>/<res>/...``,
+``videos/source/...``). ``VIDEO_STORAGE_BACKEND`` selects the implementation:
+
+* ``local`` keeps files below ``MEDIA_ROOT`` and shares renditions of
+  deduplicated titles through directory symlinks. Segments are served by
+  Django or the front server (``VIDEO_SENDFILE_MODE``).
+* ``s3`` keeps files in an S3-compatible bucket (AWS, MinIO, ...). Workers
+  transcode into a scratch directory and upload the result, and segment
+  requests are redirected to presigned URLs, so web nodes never proxy
+  video bytes.
+"""
+import contextlib
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass
+from functools import lru_cache
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from django.conf import settings
+
+
+@dataclass(frozen=True)
+class MediaStat:
+    """Size and modification time of a stored file."""
+
+    size: int
+    mtime: float
+
+    @property
+    def mtime_ns(self):
+        return int(self.mtime * 1_000_000_000)
+
+
+class LocalMediaStorage:
+    """Media below ``MEDIA_ROOT`` on a filesystem shared by web and worker nodes."""
+
+    supports_links = True
+    redirects_downloads = False
+
+    def __init__(self, root):
+        self.root = str(root)
+
+    def path(self, name):
+        return os.path.join(self.root, *name.split("/"))
+
+    def stat(self, name):
+        """Returns a ``MediaStat`` or ``None`` if the file does not exist."""
+        try:
+            stat_result = os.stat(self.path(name))
+        except OSError:
+            return None
+        return MediaStat(size=stat_result.st_size, mtime=stat_result.st_mtime)
+
+    def exists(self, name):
+        return os.path.exists(self.path(name))
+
+    def read(self, name):
+        """Returns a file's bytes. Raises ``FileNotFoundError`` if it is missing."""
+        with open(self.path(name), "rb") as f:
+            return f.read()
+
+    def input_url(self, name):
+        """Returns a location FFmpeg can read the file from."""
+        return self.path(name)
+
+    def download_url(self, name, expires_in):
+        return None
+
+    def import_source(self, name):
+        """Moves a source written to ``MEDIA_ROOT`` into storage (already there)."""
+
+    def delete(self, name):
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+
+    def delete_prefix(self, prefix):
+        """Removes a directory, or only the link if it is a shared rendition link."""
+        path = self.path(prefix)
+        if os.path.islink(path):
+            os.unlink(path)
+        elif os.path.isdir(path):
+            shutil.rmtree(path)
+
+    def clear_prefix(self, prefix):
+        """Empties a directory, following a rendition link to its target."""
+        path = os.path.realpath(self.path(prefix))
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.makedirs(path, exist_ok=True)
+
+    def link_prefix(self, source_prefix, prefix):
+        """Makes ``prefix`` a symlink to ``source_prefix``."""
+        target = self.path(source_prefix)
+        link = self.path(prefix)
+        os.makedirs(target, exist_ok=True)
+        self.delete_prefix(prefix)
+        os.makedirs(os.path.dirname(link), exist_ok=True)
+        os.symlink(os.path.relpath(target, os.path.dirname(link)), link)
+
+    @contextlib.contextmanager
+    def output_dir(self, prefixes):
+        """
+        Yields an empty local directory to write a rendition into, published
+        under every prefix on success. Linked prefixes resolve to one
+        directory, which is written in place.
+        """
+        path = os.path.realpath(self.path(prefixes[0]))
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.makedirs(path)
+        yield path
+
+
+class S3MediaStorage:
+    """Media in an S3-compatible bucket, delivered through presigned URLs."""
+
+    supports_links = False
+    redirects_downloads = True
+
+    def __init__(self, bucket, endpoint_url=None, public_endpoint_url=None,
+                 region=None, access_key=None, secret_key=None):
+        self.bucket = bucket
+        options = {
+            "region_name": region or None,
+            "aws_access_key_id": access_key or None,
+            "aws_secret_access_key": secret_key or None,
+            "config": Config(signature_version="s3v4",
+                             s3={"addressing_style": "path"}),
+        }
+        self.client = boto3.client("s3", endpoint_url=endpoint_url or None, **options)
+        # Presigning is offline; sign for the host clients actually reach.
+        self.signer = boto3.client(
+            "s3", endpoint_url=public_endpoint_url or endpoint_url or None, **options)
+
+    def stat(self, name):
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=name)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return MediaStat(size=head["ContentLength"], mtime=head["LastModified"].timestamp())
+
+    def exists(self, name):
+        return self.stat(name) is not None
+
+    def read(self, name):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=name)["Body"].read()
+        except self.client.exceptions.NoSuchKey:
+            raise FileNotFoundError(name)
+
+    def input_url(self, name):
+        return self.signer.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": name},
+            ExpiresIn=settings.VIDEO_S3_INPUT_URL_TTL)
+
+    def download_url(self, name, expires_in):
+        return self.signer.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": name},
+            ExpiresIn=expires_in)
+
+    def import_source(self, name):
+        """Uploads a source staged below ``MEDIA_ROOT`` and removes the local copy."""
+        path = os.path.join(settings.MEDIA_ROOT, *name.split("/"))
+        self.client.upload_file(path, self.bucket, name)
+        os.remove(path)
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=name)
+
+    def _keys(self, prefix):
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix.rstrip("/") + "/"):
+            for item in page.get("Contents", []):
+                yield item["Key"]
+
+    def delete_prefix(self, prefix):
+        keys = list(self._keys(prefix))
+        for start in range(0, len(keys), 1000):
+            self.client.delete_objects(Bucket=self.bucket, Delete={
+                "Objects": [{"Key": key} for key in keys[start:start + 1000]],
+                "Quiet": True,
+            })
+
+    clear_prefix = delete_prefix
+
+    def link_prefix(self, source_prefix, prefix):
+        """Copies every object below ``source_prefix`` server-side."""
+        self.delete_prefix(prefix)
+        source_prefix = source_prefix.rstrip("/") + "/"
+        for key in self._keys(source_prefix):
+            self.client.copy_object(
+                Bucket=self.bucket, Key=prefix.rstrip("/") + "/" + key[len(source_prefix):],
+                CopySource={"Bucket": self.bucket, "Key": key})
+
+    @contextlib.contextmanager
+    def output_dir(self, prefixes):
+        """
+        Yields a scratch directory; on success its files replace the objects
+        under the first prefix and are copied server-side to the others.
+        """
+        with tempfile.TemporaryDirectory(prefix="videoflix-hls-") as path:
+            yield path
+            self.delete_prefix(prefixes[0])
+            # Playlists last, so no manifest references a missing segment.
+            names = sorted(os.listdir(path), key=lambda n: n.endswith(".m3u8"))
+            for name in names:
+                self.client.upload_file(
+                    os.path.join(path, name), self.bucket, f"{prefixes[0]}/{name}",
+                    ExtraArgs={"ContentType": content_type(name)})
+            for prefix in prefixes[1:]:
+                self.link_prefix(prefixes[0], prefix)
+
+
+CONTENT_TYPES = {".m3u8": "application/vnd.apple.mpegurl", ".ts": "video/MP2T",
+                 ".json": "application/json"}
+
+
+def content_type(name):
+    return CONTENT_TYPES.get(os.path.splitext(name)[1], "application/octet-stream")
+
+
+@lru_cache(maxsize=1)
+def get_media_storage():
+    """Returns the storage configured by ``VIDEO_STORAGE_BACKEND``."""
+    if settings.VIDEO_STORAGE_BACKEND == "s3":
+        return S3MediaStorage(
+            bucket=settings.VIDEO_S3_BUCKET,
+            endpoint_url=settings.VIDEO_S3_ENDPOINT_URL,
+            public_endpoint_url=settings.VIDEO_S3_PUBLIC_ENDPOINT_URL,
+            region=settings.VIDEO_S3_REGION,
+            access_key=settings.VIDEO_S3_ACCESS_KEY_ID,
+            secret_key=settings.VIDEO_S3_SECRET_ACCESS_KEY,
+        )
+    return LocalMediaStorage(settings.MEDIA_ROOT)
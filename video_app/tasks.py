@@ -1,46 +1,411 @@
+import io
 import os
-import shutil
+import json
 import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.utils import timezone
+from core.metrics import TRANSCODE_DURATION
+from .assets import shared_video_ids, sync_shared_renditions
+from .cache import bump_catalog_version
+from .hls import (
+    LADDER, RESOLUTIONS, VARIANT_FILE, invalidate_master_playlist, rendition_prefix,
+    video_prefix,
+)
+from .models import RenditionStatus, Video, VideoRendition
+from .segment_cache import segment_cache
+from .storage import get_media_storage
+from PIL import Image, ImageOps, features
 import logging
 
 logger = logging.getLogger(__name__)
 
-def convert_resolutions(video_id: int, source_path: str):
+H264_PROFILES = {
+    "Baseline": "4200",
+    "Constrained Baseline": "42E0",
+    "Main": "4D40",
+    "High": "6400",
+}
+AAC_PROFILES = {"LC": "mp4a.40.2", "HE-AAC": "mp4a.40.5", "HE-AACv2": "mp4a.40.29"}
+
+
+def parse_media_playlist(playlist_path):
+    """Returns ``(segment_name, duration)`` pairs from a media playlist."""
+    segments = []
+    duration = None
+    with open(playlist_path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("#EXTINF:"):
+                duration = float(line[len("#EXTINF:"):].split(",")[0])
+            elif line and not line.startswith("#") and duration is not None:
+                segments.append((line, duration))
+                duration = None
+    return segments
+
+
+def codec_string(stream):
+    """Builds an RFC 6381 codec string from an ffprobe stream entry."""
+    name = stream.get("codec_name")
+    if name == "h264":
+        profile = H264_PROFILES.get(stream.get("profile"), "4D40")
+        return f"avc1.{profile}{int(stream.get('level', 31)):02X}"
+    if name == "aac":
+        return AAC_PROFILES.get(stream.get("profile"), "mp4a.40.2")
+    return None
+
+
+def probe(path):
+    """Returns ffprobe's stream entries and container duration for a media file."""
+    result = subprocess.run(
+        [
+            "ffprobe", "-v", "error",
+            "-show_entries",
+            "stream=codec_type,codec_name,profile,level,width,height:format=duration",
+            "-of", "json", path,
+        ],
+        check=True, capture_output=True, text=True,
+    )
+    return json.loads(result.stdout)
+
+
+def measure_rendition(output_dir):
+    """
+    Measures a finished rendition and stores its master playlist attributes.
+
+    BANDWIDTH is the peak segment bitrate and AVERAGE-BANDWIDTH the mean
+    over the whole stream, both computed from the segment sizes on disk.
+    Resolution and codecs come from ffprobe on the first segment.
+    """
+    segments = parse_media_playlist(os.path.join(output_dir, "index.m3u8"))
+    if not segments:
+        return None
+
+    total_bits = 0
+    total_duration = 0.0
+    peak = 0
+    for name, duration in segments:
+        bits = os.path.getsize(os.path.join(output_dir, name)) * 8
+        total_bits += bits
+        total_duration += duration
+        if duration > 0:
+            peak = max(peak, int(bits / duration))
+
+    variant = {
+        "bandwidth": peak,
+        "average_bandwidth": int(total_bits / total_duration) if total_duration else peak,
+    }
+    streams = probe(os.path.join(output_dir, segments[0][0])).get("streams", [])
+    codecs = [codec_string(stream) for stream in streams]
+    for stream in streams:
+        if stream.get("codec_type") == "video":
+            variant["width"] = stream.get("width")
+            variant["height"] = stream.get("height")
+            break
+    if all(codecs):
+        variant["codecs"] = ",".join(codecs)
+
+    with open(os.path.join(output_dir, VARIANT_FILE), "w") as f:
+        json.dump(variant, f)
+    return variant
+
+
+class TranscodeError(Exception):
+    """Raised when one or more rungs of the encoding ladder fail."""
+
+
+def probe_source(source_path):
+    """
+    Returns ``(height, duration)`` of the source's first video stream.
+    Either value is ``None`` if it could not be determined.
+    """
+    try:
+        info = probe(source_path)
+    except (OSError, subprocess.CalledProcessError, ValueError) as e:
+        # Drop the query string so presigned credentials stay out of the logs.
+        logger.warning(f"Could not probe source {source_path.split('?')[0]}: {e}")
+        return None, None
+
+    height = next(
+        (stream.get("height") for stream in info.get("streams", [])
+         if stream.get("codec_type") == "video"),
+        None,
+    )
+    try:
+        duration = float(info.get("format", {}).get("duration"))
+    except (TypeError, ValueError):
+        duration = None
+    return height, duration
+
+
+def select_rungs(height, resolutions=None):
+    """
+    Returns the ladder rungs worth encoding for a source of the given height.
+    Rungs above the source are skipped, the lowest rung is always kept.
+    ``resolutions`` restricts the result, e.g. when retrying failed rungs.
+    """
+    rungs = list(RESOLUTIONS)
+    if height:
+        rungs = [res for res in RESOLUTIONS if LADDER[res]["height"] <= height]
+        rungs = rungs or RESOLUTIONS[:1]
+    if resolutions is not None:
+        rungs = [res for res in rungs if res in resolutions]
+    return rungs
+
+
+def build_rung_command(source_path, playlist_path, rung, threads):
+    """Builds the FFmpeg command that encodes one rung of the ladder."""
+    segment_time = settings.VIDEO_HLS_SEGMENT_SECONDS
+    return [
+        "ffmpeg", "-y", "-nostdin", "-v", "error",
+        "-progress", "pipe:1", "-nostats",
+        "-i", source_path,
+        "-map", "0:v:0", "-map", "0:a:0?",
+        "-vf", f"scale=-2:{rung['height']}",
+        "-c:v", "libx264",
+        "-preset", settings.VIDEO_X264_PRESET,
+        "-b:v", rung["video_bitrate"],
+        "-maxrate", rung["maxrate"],
+        "-bufsize", rung["bufsize"],
+        # Keyframes on segment boundaries keep rungs switchable mid-stream.
+        "-force_key_frames", f"expr:gte(t,n_forced*{segment_time})",
+        "-c:a", "aac", "-b:a", rung["audio_bitrate"], "-ac", "2",
+        "-threads", str(threads),
+        "-start_number", "0",
+        "-hls_time", str(segment_time),
+        "-hls_list_size", "0",
+        "-hls_playlist_type", "vod",
+        "-f", "hls",
+        playlist_path,
+    ]
+
+
+def run_with_progress(command, on_progress, duration):
+    """
+    Runs FFmpeg and reports progress parsed from its ``-progress`` pipe.
+
+    ``on_progress`` receives a percentage and is called at most once every
+    ``VIDEO_PROGRESS_INTERVAL`` seconds. stderr is spooled to a temporary
+    file so a chatty encoder can never block on a full pipe.
+
+    Raises:
+        subprocess.CalledProcessError: If FFmpeg exits non-zero; ``stderr``
+            holds the tail of its error output.
     """
-    Background task to convert a video into HLS (480p, 720p, 1080p).
+    interval = settings.VIDEO_PROGRESS_INTERVAL
+    last_report = time.monotonic()
 
-    Uses FFmpeg with '-codec copy' for faster conversion without re-encoding.
-    Deletes existing files for the video before starting.
+    with tempfile.TemporaryFile(mode="w+") as stderr:
+        process = subprocess.Popen(
+            command, stdout=subprocess.PIPE, stderr=stderr, text=True)
+        for line in process.stdout:
+            key, _, value = line.strip().partition("=")
+            if key != "out_time_us" or not duration or not value.isdigit():
+                continue
+            now = time.monotonic()
+            if now - last_report >= interval:
+                last_report = now
+                on_progress(min(int(value) / 1e6 / duration * 100, 99.9))
+        returncode = process.wait()
+
+        if returncode:
+            stderr.seek(0)
+            raise subprocess.CalledProcessError(
+                returncode, command, stderr=stderr.read()[-2000:])
+
+
+def directory_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+def encode_rung(rendition_id, source_path, prefixes, resolution, threads, duration):
+    """
+    Encodes one rung, measures it, publishes it to media storage under
+    every prefix in ``prefixes`` and records the outcome on its
+    VideoRendition. Returns the measured attributes.
+    """
+    renditions = VideoRendition.objects.filter(pk=rendition_id)
+    storage = get_media_storage()
+    started = timezone.now()
+    renditions.update(status=RenditionStatus.RUNNING,
+                      started_at=started, progress=0)
+    # Rendition states are part of the cached catalog; progress ticks are not.
+    bump_catalog_version()
+    try:
+        with storage.output_dir(prefixes) as output_dir:
+            command = build_rung_command(
+                source_path, os.path.join(output_dir, "index.m3u8"),
+                LADDER[resolution], threads)
+            run_with_progress(
+                command, lambda percent: renditions.update(progress=percent), duration)
+            variant = measure_rendition(output_dir)
+            output_bytes = directory_size(output_dir)
+    except Exception as e:
+        finished = timezone.now()
+        error = getattr(e, "stderr", None) or str(e)
+        renditions.update(
+            status=RenditionStatus.FAILED, error=error.strip(),
+            finished_at=finished,
+            duration_seconds=(finished - started).total_seconds())
+        bump_catalog_version()
+        TRANSCODE_DURATION.labels(resolution, "failed").observe(
+            (finished - started).total_seconds())
+        raise
+    else:
+        finished = timezone.now()
+        renditions.update(
+            status=RenditionStatus.READY, progress=100, error="",
+            finished_at=finished,
+            duration_seconds=(finished - started).total_seconds(),
+            output_bytes=output_bytes)
+        bump_catalog_version()
+        TRANSCODE_DURATION.labels(resolution, "ready").observe(
+            (finished - started).total_seconds())
+        if not storage.redirects_downloads:
+            # Warm the node's segment cache with the start of the stream.
+            segment_cache.pin_rendition(output_dir, [
+                name for name, _ in parse_media_playlist(
+                    os.path.join(output_dir, "index.m3u8"))])
+        return variant
+    finally:
+        # Pool threads each open their own connection; do not leak them.
+        connection.close()
+
+
+def convert_resolutions(video_id: int, source: str, resolutions=None):
+    """
+    Background task to convert a video into an HLS encoding ladder.
+
+    Each rung of ``LADDER`` (480p, 720p, 1080p) is scaled and encoded with
+    its own bitrate. Rungs run in parallel in a pool of
+    ``VIDEO_TRANSCODE_WORKERS`` FFmpeg processes that share the worker's
+    cores, and rungs taller than the source are skipped. Every rung is
+    tracked by a VideoRendition holding its state, progress and timings.
+    Output goes to media storage; titles sharing the source get it too.
 
     Args:
         video_id (int): ID of the Video object.
-        source_path (str): Path to the source video file.
-    """
-    resolutions = ["480p", "720p", "1080p"]
-    base_dir = os.path.join(settings.MEDIA_ROOT, "videos", str(video_id))
-
-    if os.path.exists(base_dir):
-        shutil.rmtree(base_dir)
-    os.makedirs(base_dir, exist_ok=True)
-
-    for res in resolutions:
-        output_dir = os.path.join(base_dir, res)
-        os.makedirs(output_dir, exist_ok=True)
-        playlist_path = os.path.join(output_dir, "index.m3u8")
-
-        command = [
-            "ffmpeg",
-            "-i", source_path,
-            "-codec", "copy",
-            "-start_number", "0",
-            "-hls_time", "10",
-            "-hls_list_size", "0",
-            "-f", "hls",
-            playlist_path
-        ]
-
-        try:
-            subprocess.run(command, check=True)
-        except Exception as e:
-            logger.error(f"HLS Conversion failed: {e}")
\ No newline at end of file
+        source (str): Storage name of the source video file. Absolute paths
+            (from jobs enqueued by older releases) are read as they are.
+        resolutions (list, optional): Only (re-)encode these rungs, keeping
+            the others. By default the whole ladder is rebuilt.
+
+    Raises:
+        TranscodeError: If any rung failed; successful rungs are kept.
+    """
+    storage = get_media_storage()
+    source_path = source if os.path.isabs(source) else storage.input_url(source)
+    video_ids = [video_id] + [
+        shared_id for shared_id in shared_video_ids(video_id) if shared_id != video_id]
+
+    if resolutions is None:
+        for shared_id in video_ids:
+            storage.clear_prefix(video_prefix(shared_id))
+        VideoRendition.objects.filter(video_id=video_id).delete()
+
+    height, duration = probe_source(source_path)
+    rungs = select_rungs(height, resolutions)
+    cores = os.cpu_count() or 1
+    workers = max(1, min(settings.VIDEO_TRANSCODE_WORKERS or cores, len(rungs)))
+    threads = max(1, cores // workers)
+
+    jobs = {}
+    for res in rungs:
+        rendition, _ = VideoRendition.objects.update_or_create(
+            video_id=video_id, resolution=res,
+            defaults={"status": RenditionStatus.PENDING, "progress": 0,
+                      "error": "", "started_at": None, "finished_at": None},
+        )
+        jobs[res] = rendition.pk
+
+    failures = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(
+                encode_rung, jobs[res], source_path,
+                [rendition_prefix(shared_id, res) for shared_id in video_ids],
+                res, threads, duration,
+            ): res
+            for res in rungs
+        }
+        for future in as_completed(futures):
+            res = futures[future]
+            try:
+                future.result()
+            except subprocess.CalledProcessError as e:
+                failures[res] = (e.stderr or "").strip()
+                logger.error(f"HLS Conversion of {res} failed for video {video_id}: {failures[res]}")
+            except Exception as e:
+                failures[res] = str(e)
+                logger.exception(f"HLS Conversion of {res} failed for video {video_id}")
+
+    sync_shared_renditions(video_id)
+    for shared_id in shared_video_ids(video_id):
+        invalidate_master_playlist(shared_id)
+    bump_catalog_version()
+
+    if failures:
+        raise TranscodeError(
+            f"Video {video_id}: failed rungs {', '.join(sorted(failures))}")
+
+
+THUMBNAIL_FORMATS = {
+    "avif": ("AVIF", {"quality": 55}),
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+
+def thumbnail_dir(video_id):
+    return f"thumbnails/derived/{video_id}"
+
+
+def generate_thumbnails(video_id: int):
+    """
+    Background task that renders the video's thumbnail at every width in
+    ``VIDEO_THUMBNAIL_WIDTHS`` as AVIF (when Pillow supports it), WebP and a
+    JPEG fallback. Widths larger than the original are skipped; a
+    thumbnail narrower than the largest configured width also gets a
+    variant at its original width, so the largest variant stays sharp.
+    """
+    video = Video.objects.filter(pk=video_id).only("thumbnail").first()
+    if not video or not video.thumbnail:
+        return None
+
+    with video.thumbnail.open("rb") as f:
+        image = ImageOps.exif_transpose(Image.open(f))
+        image.load()
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+    widths = sorted({w for w in settings.VIDEO_THUMBNAIL_WIDTHS if w < image.width}
+                    | {min(image.width, max(settings.VIDEO_THUMBNAIL_WIDTHS))})
+    formats = [name for name in THUMBNAIL_FORMATS
+               if name != "avif" or features.check("avif")]
+
+    directory = thumbnail_dir(video_id)
+    if default_storage.exists(directory):
+        for name in default_storage.listdir(directory)[1]:
+            default_storage.delete(f"{directory}/{name}")
+
+    thumbnails = {"source": video.thumbnail.name}
+    for width in widths:
+        height = round(image.height * width / image.width)
+        resized = image.resize((width, height), Image.LANCZOS)
+        for name in formats:
+            pil_format, options = THUMBNAIL_FORMATS[name]
+            frame = resized.convert("RGB") if name == "jpeg" else resized
+            buffer = io.BytesIO()
+            frame.save(buffer, pil_format, **options)
+            path = default_storage.save(
+                f"{directory}/{width}.{name}", ContentFile(buffer.getvalue()))
+            thumbnails.setdefault(name, {})[str(width)] = path
+
+    Video.objects.filter(pk=video_id).update(thumbnails=thumbnails)
+    bump_catalog_version()
+    return thumbnails
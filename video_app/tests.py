@@ -0,0 +1,393 @@
+import asyncio
+import base64
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+from video_app.api.streaming import serve_file
+from video_app.cache import catalog_version
+from video_app.hls import (
+    invalidate_master_playlist, manifest_cache, manifest_name, rendition_prefix, segment_name)
+from video_app.models import RenditionStatus, Video, VideoRendition, VideoUpload
+from video_app.signing import current_expiry, segment_signature
+from video_app.storage import get_media_storage
+from video_app.tasks import convert_resolutions, generate_thumbnails
+from video_app.uploads import TUS_VERSION, finish_upload
+
+User = get_user_model()
+
+
+class MediaRootTestCase(APITestCase):
+    """Runs each test against an empty temporary ``MEDIA_ROOT``."""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        get_media_storage.cache_clear()
+        self.addCleanup(get_media_storage.cache_clear)
+        self.media_root = media_root
+
+    def login(self, **fields):
+        user = User.objects.create_user(
+            username="viewer@example.com", email="viewer@example.com",
+            password="secret-password", **fields)
+        self.client.cookies["access_token"] = str(RefreshToken.for_user(user).access_token)
+        return user
+
+
+class VideoUploadTests(MediaRootTestCase):
+
+    data = bytes(range(256)) * 8
+
+    def setUp(self):
+        super().setUp()
+        self.login(is_staff=True)
+        metadata = ",".join(
+            f"{key} {base64.b64encode(value.encode()).decode()}"
+            for key, value in {"filename": "movie.mp4", "title": "Movie"}.items())
+        response = self.client.post(
+            "/api/video/uploads/", HTTP_UPLOAD_LENGTH=str(len(self.data)),
+            HTTP_UPLOAD_METADATA=metadata, HTTP_TUS_RESUMABLE=TUS_VERSION)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.location = response["Location"]
+
+    def patch(self, offset, data, content_length=None):
+        """Sends a chunk; a ``content_length`` above ``len(data)`` simulates a dropped connection."""
+        return self.client.generic(
+            "PATCH", self.location,
+            content_type="application/offset+octet-stream",
+            HTTP_UPLOAD_OFFSET=str(offset),
+            HTTP_TUS_RESUMABLE=TUS_VERSION,
+            CONTENT_LENGTH=str(len(data) if content_length is None else content_length),
+            **{"wsgi.input": io.BytesIO(data)},
+        )
+
+    def head_offset(self):
+        response = self.client.head(self.location, HTTP_TUS_RESUMABLE=TUS_VERSION)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return int(response["Upload-Offset"])
+
+    def test_head_reports_bytes_of_partial_chunk(self):
+        response = self.patch(0, self.data[:300], content_length=1000)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.head_offset(), 300)
+
+    def test_wrong_offset_conflicts(self):
+        self.assertEqual(self.patch(0, self.data[:500]).status_code, status.HTTP_204_NO_CONTENT)
+
+        response = self.patch(1000, self.data[1000:1500])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response["Upload-Offset"], "500")
+        response = self.patch(0, self.data[:500])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.head_offset(), 500)
+
+    def test_resume_after_dropped_patch(self):
+        self.patch(0, self.data[:700], content_length=len(self.data))
+        offset = self.head_offset()
+        self.assertEqual(offset, 700)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.patch(offset, self.data[offset:])
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(response["Upload-Offset"], str(len(self.data)))
+        # Finalisation is left to a job enqueued on commit.
+        self.assertEqual(len(callbacks), 1)
+        self.assertFalse(Video.objects.exists())
+
+        upload = VideoUpload.objects.get()
+        with mock.patch("video_app.signals.enqueue") as enqueue:
+            with self.captureOnCommitCallbacks() as callbacks:
+                video_id = finish_upload(upload.id)
+            # The transcode is only enqueued once the video row is committed.
+            enqueue.assert_not_called()
+            for callback in callbacks:
+                callback()
+        upload.refresh_from_db()
+        self.assertEqual(upload.video_id, video_id)
+        with upload.video.source.open("rb") as f:
+            self.assertEqual(f.read(), self.data)
+        enqueue.assert_called_once_with(convert_resolutions, video_id, upload.video.source.name)
+        self.assertEqual(finish_upload(upload.id), video_id)
+
+
+class VideoSearchPaginationTests(MediaRootTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.login()
+        # Many equal ranks, so pages break in the middle of ties.
+        videos = ([("Ocean ocean ocean", "")] + [("Ocean story", "")] * 7
+                  + [("Deep blue", "A documentary about the ocean.")] * 4
+                  + [("Desert", "Sand dunes.")])
+        for title, description in videos:
+            video = Video.objects.create(title=title, description=description)
+            VideoRendition.objects.create(
+                video=video, resolution="480p", status=RenditionStatus.READY)
+
+    def test_pages_through_tied_ranks_without_gaps_or_repeats(self):
+        url = "/api/video/search/?q=ocean&page_size=2"
+        seen = []
+        # Bounded: a cursor that lands back inside a tie loops forever.
+        for _ in range(Video.objects.count()):
+            if not url:
+                break
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen += [video["id"] for video in response.data["results"]]
+            url = response.data["next"]
+
+        expected = list(Video.objects.exclude(title="Desert").values_list("id", flat=True))
+        self.assertEqual(sorted(seen), sorted(expected))
+        self.assertEqual(Video.objects.get(pk=seen[0]).title, "Ocean ocean ocean")
+
+
+class CatalogCacheTests(MediaRootTestCase):
+
+    def test_catalog_version_is_bumped_on_commit(self):
+        version = catalog_version()
+        with self.captureOnCommitCallbacks() as callbacks:
+            Video.objects.create(title="Movie")
+            self.assertEqual(catalog_version(), version)
+        for callback in callbacks:
+            callback()
+        self.assertGreater(catalog_version(), version)
+
+    def test_list_leaves_out_live_progress(self):
+        self.login()
+        video = Video.objects.create(title="Movie")
+        VideoRendition.objects.create(
+            video=video, resolution="480p", status=RenditionStatus.READY, progress=100)
+        response = self.client.get("/api/video/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data["results"] if "results" in response.data else response.data
+        rendition = results[0]["renditions"][0]
+        self.assertEqual(rendition["status"], RenditionStatus.READY)
+        self.assertNotIn("progress", rendition)
+
+
+class ThumbnailSignalTests(MediaRootTestCase):
+
+    def test_thumbnail_job_is_enqueued_on_commit(self):
+        with mock.patch("video_app.signals.enqueue") as enqueue:
+            with self.captureOnCommitCallbacks() as callbacks:
+                video = Video.objects.create(
+                    title="Movie", thumbnail=SimpleUploadedFile("poster.jpg", b"jpeg"))
+                # The worker must not look for the row before it is committed.
+                enqueue.assert_not_called()
+            for callback in callbacks:
+                callback()
+        enqueue.assert_called_once_with(generate_thumbnails, video.id)
+
+
+class ServeFileTests(SimpleTestCase):
+
+    data = bytes(range(100))
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, "index0.ts")
+        with open(self.path, "wb") as f:
+            f.write(self.data)
+
+    def serve(self, **headers):
+        return serve_file(RequestFactory().get("/", **headers), self.path, "video/MP2T")
+
+    def body(self, response):
+        return b"".join(response.streaming_content) if response.streaming else response.content
+
+    def test_range_returns_partial_content(self):
+        response = self.serve(HTTP_RANGE="bytes=10-19")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 10-19/100")
+        self.assertEqual(response["Content-Length"], "10")
+        self.assertEqual(self.body(response), self.data[10:20])
+
+    def test_suffix_and_open_ended_ranges(self):
+        response = self.serve(HTTP_RANGE="bytes=-30")
+        self.assertEqual(response["Content-Range"], "bytes 70-99/100")
+        self.assertEqual(self.body(response), self.data[70:])
+
+        response = self.serve(HTTP_RANGE="bytes=90-")
+        self.assertEqual(response["Content-Range"], "bytes 90-99/100")
+        self.assertEqual(self.body(response), self.data[90:])
+
+    def test_unsatisfiable_range(self):
+        response = self.serve(HTTP_RANGE="bytes=100-200")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */100")
+
+    def test_multiple_ranges_fall_back_to_full_body(self):
+        response = self.serve(HTTP_RANGE="bytes=0-9,20-29")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.data)
+
+    def test_stale_if_range_returns_full_body(self):
+        etag = self.serve()["ETag"]
+        self.assertEqual(self.serve(HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE=etag).status_code, 206)
+
+        response = self.serve(HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.data)
+
+    @override_settings(VIDEO_SENDFILE_MODE="nginx", VIDEO_SENDFILE_URL="/protected-media/")
+    def test_offload_mode_sets_accel_redirect(self):
+        with override_settings(MEDIA_ROOT=os.path.dirname(self.path)):
+            response = self.serve(HTTP_RANGE="bytes=0-9")
+        self.assertEqual(response["X-Accel-Redirect"], "/protected-media/index0.ts")
+        self.assertEqual(response.content, b"")
+
+
+class ManifestCacheTests(MediaRootTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.login()
+        manifest_cache.clear()
+        self.addCleanup(manifest_cache.clear)
+        self.video = Video.objects.create(title="Movie")
+        self.path = get_media_storage().path(manifest_name(self.video.id, "480p"))
+        self.write_manifest(b"#EXTM3U\nindex0.ts\n")
+        self.url = f"/api/video/{self.video.id}/480p/index.m3u8"
+
+    def write_manifest(self, body, mtime=None):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "wb") as f:
+            f.write(body)
+        if mtime is not None:
+            os.utime(self.path, (mtime, mtime))
+
+    def test_matching_etag_returns_not_modified(self):
+        etag = self.client.get(self.url)["ETag"]
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(response.content, b"")
+
+    def test_etag_changes_with_file_mtime(self):
+        etag = self.client.get(self.url)["ETag"]
+        self.write_manifest(b"#EXTM3U\nindex0.ts\n", mtime=os.stat(self.path).st_mtime + 10)
+
+        with mock.patch.object(manifest_cache, "recheck", 0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_async_miss_reads_storage_off_the_event_loop(self):
+        load = manifest_cache._load
+        threads = []
+
+        def record_thread(*args):
+            threads.append(threading.get_ident())
+            return load(*args)
+
+        with mock.patch.object(manifest_cache, "_load", record_thread), \
+                mock.patch.object(manifest_cache, "recheck", 3600):
+            entry = asyncio.run(manifest_cache.aget(self.video.id, "480p"))
+            self.assertEqual(entry.body, b"#EXTM3U\nindex0.ts\n")
+            asyncio.run(manifest_cache.aget(self.video.id, "480p"))
+        # Loaded once, in a worker thread; the second call is served from memory.
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], threading.get_ident())
+
+    def test_delete_invalidates_cached_manifest(self):
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        self.assertIsNotNone(manifest_cache.get(self.video.id, "480p"))
+        video_id = self.video.id
+        with mock.patch.object(manifest_cache, "recheck", 3600):
+            self.video.delete()
+            self.assertIsNone(manifest_cache.get(video_id, "480p"))
+
+
+class MasterPlaylistTests(MediaRootTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.login()
+        self.video = Video.objects.create(title="Movie")
+        invalidate_master_playlist(self.video.id)
+        self.addCleanup(invalidate_master_playlist, self.video.id)
+        self.url = f"/api/video/{self.video.id}/master.m3u8"
+
+    def test_lists_measured_renditions_and_honours_etag(self):
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+
+        directory = get_media_storage().path(rendition_prefix(self.video.id, "480p"))
+        os.makedirs(directory)
+        with open(os.path.join(directory, "index.m3u8"), "wb") as f:
+            f.write(b"#EXTM3U\n")
+        with open(os.path.join(directory, "variant.json"), "w") as f:
+            f.write('{"bandwidth": 1200000, "width": 854, "height": 480}')
+        invalidate_master_playlist(self.video.id)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(b"BANDWIDTH=1200000,RESOLUTION=854x480\n480p/index.m3u8", response.content)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+class SegmentSignatureTests(MediaRootTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.video = Video.objects.create(title="Movie")
+        for segment in ("index0.ts", "index1.ts"):
+            path = get_media_storage().path(segment_name(self.video.id, "480p", segment))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(b"\x47" * 188)
+
+    def get(self, segment="index0.ts", resolution="480p", expires=None, signature=None, video_id=None):
+        expires = current_expiry() if expires is None else expires
+        if signature is None:
+            signature = segment_signature(self.video.id, resolution, segment, expires)
+        return self.client.get(
+            f"/api/video/{video_id or self.video.id}/{resolution}/{segment}/",
+            {"exp": expires, "sig": signature})
+
+    def assertDenied(self, response):
+        self.assertIn(response.status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
+
+    def test_valid_signature_needs_no_login(self):
+        self.assertEqual(self.get().status_code, status.HTTP_200_OK)
+
+    def test_expired_signature_is_rejected(self):
+        expires = int(time.time()) - 1
+        self.assertDenied(self.get(expires=expires))
+
+    def test_tampered_signature_is_rejected(self):
+        signature = segment_signature(self.video.id, "480p", "index0.ts", current_expiry())
+        self.assertDenied(self.get(signature=signature[:-1] + ("0" if signature[-1] != "0" else "1")))
+        self.assertDenied(self.get(expires=current_expiry() + 60, signature=signature))
+
+    def test_signature_is_bound_to_segment_and_resolution(self):
+        expires = current_expiry()
+        signature = segment_signature(self.video.id, "480p", "index0.ts", expires)
+        self.assertDenied(self.get(segment="index1.ts", expires=expires, signature=signature))
+        self.assertDenied(self.get(resolution="720p", expires=expires, signature=signature))
+
+    def test_unsigned_request_falls_back_to_login(self):
+        url = f"/api/video/{self.video.id}/480p/index0.ts/"
+        self.assertDenied(self.client.get(url))
+        self.login()
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+    def test_invalid_signature_with_login_still_checks_the_video(self):
+        self.login()
+        response = self.get(signature="bogus", video_id=self.video.id + 1000)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.content, b"Video not found")
@@ -0,0 +1,139 @@
+"""
+Resumable (tus-style) source uploads.
+
+Chunks are written straight into the final source file at the offset the
+server has acknowledged, a bounded buffer at a time, so memory use does
+not depend on the upload size and an interrupted chunk only loses the
+bytes that never arrived.
+"""
+import base64
+import binascii
+import hashlib
+import os
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import transaction
+from django.http.request import UnreadablePostError
+from django.utils.text import get_valid_filename
+from .assets import attach_stored_source, path_sha256
+from .models import Video, VideoUpload
+
+TUS_VERSION = "1.0.0"
+
+
+class HashingFileUploadHandler(TemporaryFileUploadHandler):
+    """
+    Spools multipart uploads to a temporary file like Django's default
+    handler and computes their SHA-256 on the fly, exposed as ``sha256``
+    on the uploaded file, so deduplication needs no second read.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.sha256 = self.sha256.hexdigest()
+        return file
+
+
+def parse_upload_metadata(header):
+    """
+    Parses a tus ``Upload-Metadata`` header: comma-separated
+    ``key base64value`` pairs. Undecodable values are ignored.
+    """
+    metadata = {}
+    for pair in header.split(","):
+        key, _, value = pair.strip().partition(" ")
+        if not key:
+            continue
+        try:
+            metadata[key] = base64.b64decode(value, validate=True).decode("utf-8")
+        except (binascii.Error, UnicodeDecodeError):
+            continue
+    return metadata
+
+
+def create_upload(user, length, metadata):
+    """Registers a new upload and creates its empty source file."""
+    upload = VideoUpload(
+        user=user,
+        length=length,
+        title=metadata.get("title") or metadata["filename"],
+        description=metadata.get("description", ""),
+        category=metadata.get("category") or Video._meta.get_field("category").default,
+    )
+    filename = get_valid_filename(
+        os.path.basename(metadata.get("filename") or "source.mp4"))
+    upload.path = f"videos/source/{upload.id}_{filename}"
+
+    absolute_path = os.path.join(settings.MEDIA_ROOT, upload.path)
+    os.makedirs(os.path.dirname(absolute_path), exist_ok=True)
+    open(absolute_path, "wb").close()
+    upload.save()
+    return upload
+
+
+def append_chunk(upload, stream, count):
+    """
+    Appends up to ``count`` bytes from ``stream`` at the upload's offset.
+
+    The offset is advanced by the bytes actually written, even if the client
+    goes away mid-chunk, so the next request can resume from there.
+    Returns ``False`` if the chunk was interrupted.
+    """
+    chunk_size = settings.VIDEO_UPLOAD_CHUNK_SIZE
+    written = 0
+    complete = True
+    try:
+        with open(os.path.join(settings.MEDIA_ROOT, upload.path), "r+b") as f:
+            f.seek(upload.offset)
+            while written < count:
+                data = stream.read(min(chunk_size, count - written))
+                if not data:
+                    complete = False
+                    break
+                f.write(data)
+                written += len(data)
+    except UnreadablePostError:
+        complete = False
+    finally:
+        upload.offset += written
+        upload.save(update_fields=["offset"])
+    return complete
+
+
+def finish_upload(upload_id):
+    """
+    RQ job that creates the Video for a completed upload. The source is
+    hashed before any lock is taken, so the last PATCH returns at once
+    however large the master is. A master that is already known is
+    discarded in favour of the existing asset. Saving the video triggers
+    the usual transcode enqueue in ``video_app.signals``. Running it again
+    for a finished upload does nothing. Returns the video id.
+    """
+    upload = VideoUpload.objects.get(pk=upload_id)
+    if upload.video_id or not upload.is_complete:
+        return upload.video_id
+    sha256 = path_sha256(os.path.join(settings.MEDIA_ROOT, upload.path))
+
+    with transaction.atomic():
+        upload = VideoUpload.objects.select_for_update().get(pk=upload_id)
+        if upload.video_id:
+            return upload.video_id
+        video = Video(
+            title=upload.title,
+            description=upload.description,
+            category=upload.category,
+        )
+        attach_stored_source(video, upload.path, sha256)
+        video.save()
+        upload.path = video.source.name
+        upload.video = video
+        upload.save(update_fields=["path", "video"])
+    return video.id